@@ -1,7 +1,22 @@
+import argparse
+import cProfile
+import errno
+import fnmatch
+import hashlib
+import json
+import mmap
 import os
+import random
 import shutil
+import struct
 import sys
+import tempfile
+import threading
 import time
+import uuid
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -10,46 +25,2351 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout
                              QSpinBox, QTextEdit, QFileDialog, QWidget, 
                              QMessageBox, QInputDialog, QGroupBox, QCheckBox,
                              QComboBox, QTabWidget, QTableWidget, QTableWidgetItem)
-from PyQt5.QtCore import QTimer, Qt, QDate
+from PyQt5.QtGui import QDesktopServices
+from PyQt5.QtCore import QTimer, Qt, QDate, QUrl, pyqtSignal
+
+# 应用数据目录(冲突队列等持久化数据)
+APP_DATA_DIR = os.path.join(os.path.expanduser('~'), '.sync_tool')
+
+# 历史记录中展示的指标名称
+METRIC_LABELS = {
+    'echo_events_dropped': "丢弃回声事件",
+    'sync_passes_avoided': "避免同步次数",
+    'sparse_files_copied': "稀疏文件数",
+    'sparse_bytes_skipped': "跳过空洞字节数",
+    'dirs_listed': "重新列出目录数",
+    'dirs_reused': "复用缓存目录数",
+    'small_files_copied': "小文件快速复制数",
+    'verify_checked': "已校验文件数",
+    'verify_mismatches': "校验不一致数",
+    'verify_requeued': "重新复制数",
+    'journal_ops_replayed': "重放未完成操作数",
+    'fanout_reads_saved': "扇出节省读取数",
+    'fanout_failures': "扇出失败目标数",
+    'versions_saved': "保存旧版本数",
+    'version_bytes_stored': "版本库新增字节数",
+    'shards_run': "分片数",
+    'tail_appends': "尾部追加数",
+    'tail_bytes_saved': "尾部追加节省字节数",
+    'plan_copy_failures': "按计划复制失败数",
+}
+
+def format_metrics(metrics):
+    return ', '.join(f"{METRIC_LABELS.get(key, key)}: {value}" for key, value in metrics.items() if value)
+
+# 是否支持按数据区段(SEEK_DATA/SEEK_HOLE)复制稀疏文件
+SPARSE_COPY_SUPPORTED = hasattr(os, 'SEEK_DATA') and hasattr(os, 'SEEK_HOLE')
+
+def is_sparse_file(path, stat):
+    # 实际分配的块少于文件大小时再用 SEEK_HOLE 确认确实存在空洞；
+    # 压缩文件系统上的文件和内联存储的小文件分配的块同样偏少，但没有空洞
+    if getattr(stat, 'st_blocks', None) is None or stat.st_blocks * 512 >= stat.st_size:
+        return False
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        return os.lseek(fd, 0, os.SEEK_HOLE) < stat.st_size
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+def sparse_copy(src_path, dest_path, chunk_size=1024 * 1024):
+    # 只复制已分配的数据区段，目标文件保留空洞；返回跳过的字节数
+    size = os.path.getsize(src_path)
+    copied = 0
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        dest_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            offset = 0
+            while offset < size:
+                try:
+                    data_start = os.lseek(src_fd, offset, os.SEEK_DATA)
+                except OSError as e:
+                    # ENXIO 表示之后全部是空洞
+                    if e.errno == errno.ENXIO:
+                        break
+                    raise
+                data_end = os.lseek(src_fd, data_start, os.SEEK_HOLE)
+                
+                position = data_start
+                while position < data_end:
+                    chunk = os.pread(src_fd, min(chunk_size, data_end - position), position)
+                    if not chunk:
+                        break
+                    os.pwrite(dest_fd, chunk, position)
+                    position += len(chunk)
+                copied += position - data_start
+                offset = data_end
+            os.ftruncate(dest_fd, size)
+        finally:
+            os.close(dest_fd)
+    finally:
+        os.close(src_fd)
+    
+    shutil.copystat(src_path, dest_path)
+    return size - copied
+
+def fanout_copy(src_path, dest_paths, chunk_size=1024 * 1024):
+    # 只读取一次源文件，每个数据块同时写入所有目标；某个目标出错时只放弃该目标。
+    # 返回 {目标路径: 异常}，读取源文件出错时直接抛出
+    failures = {}
+    outputs = {}
+    with open(src_path, 'rb') as src:
+        try:
+            for dest_path in dest_paths:
+                try:
+                    outputs[dest_path] = open(dest_path, 'wb')
+                except OSError as e:
+                    failures[dest_path] = e
+            
+            buffer = bytearray(chunk_size)
+            view = memoryview(buffer)
+            while outputs:
+                count = src.readinto(buffer)
+                if not count:
+                    break
+                for dest_path, output in list(outputs.items()):
+                    try:
+                        output.write(view[:count])
+                    except OSError as e:
+                        failures[dest_path] = e
+                        del outputs[dest_path]
+                        try:
+                            output.close()
+                        except OSError:
+                            pass
+        finally:
+            for dest_path, output in outputs.items():
+                try:
+                    output.close()
+                except OSError as e:
+                    failures[dest_path] = e
+    
+    for dest_path in dest_paths:
+        if dest_path not in failures:
+            try:
+                shutil.copystat(src_path, dest_path)
+            except OSError as e:
+                failures[dest_path] = e
+    return failures
+
+# 不小于该大小的文件在只追加增长时只传输新增的尾部
+TAIL_MIN_SIZE = 1024 * 1024
+
+def append_tail(src_path, dest_path, block_size=64 * 1024):
+    # 目标是源文件的前缀(只追加增长)时只把新增的尾部追加到目标，返回追加的字节数。
+    # 通过比较首块和前缀末尾的边界块判断，不是追加增长时返回 None，由调用方完整复制
+    with open(src_path, 'rb') as src, open(dest_path, 'r+b') as dest:
+        src_size = os.fstat(src.fileno()).st_size
+        dest_size = os.fstat(dest.fileno()).st_size
+        if not 0 < dest_size < src_size:
+            return None
+        for offset in sorted({0, max(dest_size - block_size, 0)}):
+            length = min(block_size, dest_size - offset)
+            src.seek(offset)
+            dest.seek(offset)
+            if src.read(length) != dest.read(length):
+                return None
+        
+        src.seek(dest_size)
+        dest.seek(dest_size)
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+        appended = dest.tell() - dest_size
+    shutil.copystat(src_path, dest_path)
+    return appended
+
+# 小于该大小的文件按目录分组，走小文件快速复制路径
+SMALL_FILE_THRESHOLD = 64 * 1024
+
+# 是否支持基于 dir_fd 的相对路径系统调用
+DIR_FD_SUPPORTED = (hasattr(os, 'O_DIRECTORY') and hasattr(os, 'readv')
+                    and os.open in os.supports_dir_fd and os.utime in os.supports_dir_fd)
+
+class SmallFileCopier:
+    # 小文件快速复制：整批文件共用打开的源/目标目录，使用 dir_fd 相对路径的 open/utime，
+    # 每个工作线程复用一块预分配缓冲区
+    def __init__(self, buffer_size=SMALL_FILE_THRESHOLD):
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+    
+    def _buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = memoryview(bytearray(self.buffer_size))
+        return buffer
+    
+    def copy_batch(self, src_dir, dest_dirs, names):
+        # 每个文件只读取一次，写入所有目标目录；某个目标写入失败不影响其他目标。
+        # 返回 (已复制的 (目标目录, 文件名), 失败的 (目标目录, 文件名))，失败的文件由调用方走普通复制
+        buffer = self._buffer()
+        copied, failed = [], []
+        src_dir_fd = os.open(src_dir, os.O_RDONLY | os.O_DIRECTORY)
+        dest_dir_fds = []
+        try:
+            for dest_dir in dest_dirs:
+                try:
+                    dest_dir_fds.append((dest_dir, os.open(dest_dir, os.O_RDONLY | os.O_DIRECTORY)))
+                except OSError:
+                    failed.extend((dest_dir, name) for name in names)
+            
+            for name in names:
+                try:
+                    stat, length = self._read_one(src_dir_fd, name, buffer)
+                except OSError:
+                    failed.extend((dest_dir, name) for dest_dir, _ in dest_dir_fds)
+                    continue
+                for dest_dir, dest_dir_fd in dest_dir_fds:
+                    try:
+                        self._write_one(dest_dir_fd, name, buffer, length, stat)
+                        copied.append((dest_dir, name))
+                    except OSError:
+                        failed.append((dest_dir, name))
+        finally:
+            for _, dest_dir_fd in dest_dir_fds:
+                os.close(dest_dir_fd)
+            os.close(src_dir_fd)
+        return copied, failed
+    
+    def _read_one(self, src_dir_fd, name, buffer):
+        src_fd = os.open(name, os.O_RDONLY, dir_fd=src_dir_fd)
+        try:
+            stat = os.fstat(src_fd)
+            length = 0
+            while length < len(buffer):
+                count = os.readv(src_fd, [buffer[length:]])
+                if not count:
+                    break
+                length += count
+            if length == len(buffer):
+                # 文件在扫描后变大，超出缓冲区
+                raise OSError(errno.EFBIG, "文件超出小文件缓冲区", name)
+        finally:
+            os.close(src_fd)
+        return stat, length
+    
+    def _write_one(self, dest_dir_fd, name, buffer, length, stat):
+        dest_fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600, dir_fd=dest_dir_fd)
+        try:
+            written = 0
+            while written < length:
+                written += os.write(dest_fd, buffer[written:length])
+            os.fchmod(dest_fd, stat.st_mode & 0o7777)
+        finally:
+            os.close(dest_fd)
+        os.utime(name, ns=(stat.st_atime_ns, stat.st_mtime_ns), dir_fd=dest_dir_fd)
+
+class DirectoryScanCache:
+    # 缓存上次扫描时每个目录的修改时间和条目列表；
+    # 目录修改时间未变时直接复用列表而不再 listdir，只重新读取文件状态
+    def __init__(self):
+        self._entries = {}
+    
+    def _forget(self, path):
+        prefix = path + os.sep
+        for key in [key for key in self._entries if key == path or key.startswith(prefix)]:
+            del self._entries[key]
+    
+    def list_dir(self, path, trust_window, metrics):
+        # 列出单个目录，返回 (dirs, files)；目录不存在或无法读取时返回 None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._forget(path)
+            return None
+        
+        cached = self._entries.get(path)
+        # 列出时目录修改时间仍在信任窗口内，则之后同一时间刻度内的变更可能不改变修改时间，
+        # 这样的列表永远不能复用；只有列出时间比修改时间晚过信任窗口的列表才可信
+        if (cached and cached[0] == stat.st_mtime_ns
+                and cached[3] - stat.st_mtime_ns / 1e9 > trust_window):
+            metrics['dirs_reused'] += 1
+            return list(cached[1]), list(cached[2])
+        
+        listed_at = time.time()
+        dirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif not entry.is_dir():
+                        files.append(entry.name)
+        except OSError:
+            return None
+        if cached:
+            for name in set(cached[1]) - set(dirs):
+                self._forget(os.path.join(path, name))
+        self._entries[path] = (stat.st_mtime_ns, dirs, files, listed_at)
+        metrics['dirs_listed'] += 1
+        return list(dirs), list(files)
+    
+    def walk(self, top, trust_window, metrics):
+        # 输出格式与 os.walk 相同: (root, dirs, files)
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            listing = self.list_dir(root, trust_window, metrics)
+            if listing is None:
+                continue
+            dirs, files = listing
+            yield root, dirs, list(files)
+            stack.extend(os.path.join(root, name) for name in reversed(dirs))
+
+def file_checksum(path):
+    # 通过内存映射读取计算校验和，在进程池中运行，避免受 GIL 和缓冲区复制限制
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+# 目录树清单格式：文件头 + 按路径排序的定长条目表 + 字符串表(第一个字符串为根路径)
+MANIFEST_MAGIC = b'STMF'
+MANIFEST_VERSION = 1
+MANIFEST_HEADER = struct.Struct('<4sHHQQIq')  # 标识, 版本, 标志, 条目数, 字符串表偏移, 根路径长度, 生成时间(ns)
+MANIFEST_ENTRY = struct.Struct('<QIIQq')  # 路径偏移, 路径长度, 保留, 大小, 修改时间(ns)
+
+def manifest_sort_key(rel_path):
+    # 逐级按名称排序，与按名称排序的深度优先遍历顺序一致
+    return rel_path.replace('/', '\0')
+
+def iter_tree_entries(root, prefix=''):
+    # 按清单排序规则遍历目录树，输出 (相对路径, 大小, 修改时间ns)；相对路径统一使用 '/'
+    try:
+        with os.scandir(os.path.join(root, prefix) if prefix else root) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        rel_path = f"{prefix}/{entry.name}" if prefix else entry.name
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_tree_entries(root, rel_path)
+        elif entry.is_file():
+            stat = entry.stat()
+            yield rel_path, stat.st_size, stat.st_mtime_ns
+
+def write_manifest(root, out_path, entries):
+    # entries 须已按 manifest_sort_key 排序；条目表和字符串表分开流式写入，返回条目数
+    root_bytes = os.path.abspath(root).encode('utf-8')
+    count = 0
+    with open(out_path, 'wb') as out, tempfile.TemporaryFile() as strings:
+        out.write(b'\0' * MANIFEST_HEADER.size)
+        strings.write(root_bytes)
+        offset = len(root_bytes)
+        for rel_path, size, mtime_ns in entries:
+            data = rel_path.encode('utf-8')
+            out.write(MANIFEST_ENTRY.pack(offset, len(data), 0, size, mtime_ns))
+            strings.write(data)
+            offset += len(data)
+            count += 1
+        
+        strtab_offset = out.tell()
+        strings.seek(0)
+        shutil.copyfileobj(strings, out)
+        out.seek(0)
+        out.write(MANIFEST_HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, 0, count,
+                                       strtab_offset, len(root_bytes), time.time_ns()))
+    return count
+
+class Manifest:
+    # 以内存映射方式打开的清单，打开时不读取条目，可顺序遍历、随机访问和二分查找
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, _, self.count, self._strtab,
+             root_len, self.created_ns) = MANIFEST_HEADER.unpack_from(self._map, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise ValueError(f"不是有效的清单文件: {file_path}")
+        if magic != MANIFEST_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的清单文件: {file_path}")
+        if version > MANIFEST_VERSION:
+            self.close()
+            raise ValueError(f"不支持的清单版本: {version}")
+        self.root = self._map[self._strtab:self._strtab + root_len].decode('utf-8')
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset, length, _, size, mtime_ns = MANIFEST_ENTRY.unpack_from(
+            self._map, MANIFEST_HEADER.size + index * MANIFEST_ENTRY.size)
+        start = self._strtab + offset
+        return self._map[start:start + length].decode('utf-8'), size, mtime_ns
+    
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+    
+    def find(self, rel_path):
+        key = manifest_sort_key(rel_path)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if manifest_sort_key(self[middle][0]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self[low][0] == rel_path:
+            return self[low]
+        return None
+    
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+def open_tree_entries(location):
+    # 位置可以是目录(实时扫描)或清单文件；返回 (根路径, 已排序的条目流)
+    if os.path.isdir(location):
+        return os.path.abspath(location), iter_tree_entries(location)
+    manifest = Manifest(location)
+    return manifest.root, iter(manifest)
+
+def plan_manifest_sync(source_entries, dest_entries, sync_direction="source_to_dest"):
+    # 对两个已排序的条目流做归并连接，输出需要复制的 (相对路径, 方向)，方向为 to_dest 或 to_source；
+    # 规则与完整同步相同：缺失或较旧的一侧被覆盖，单向同步只会输出 to_dest
+    bidirectional = sync_direction == "bidirectional"
+    source_iter, dest_iter = iter(source_entries), iter(dest_entries)
+    src, dest = next(source_iter, None), next(dest_iter, None)
+    while src is not None or dest is not None:
+        if dest is None or (src is not None and manifest_sort_key(src[0]) < manifest_sort_key(dest[0])):
+            yield src[0], 'to_dest'
+            src = next(source_iter, None)
+        elif src is None or manifest_sort_key(dest[0]) < manifest_sort_key(src[0]):
+            if bidirectional:
+                yield dest[0], 'to_source'
+            dest = next(dest_iter, None)
+        else:
+            if src[2] > dest[2]:
+                yield src[0], 'to_dest'
+            elif bidirectional and dest[2] > src[2]:
+                yield dest[0], 'to_source'
+            src, dest = next(source_iter, None), next(dest_iter, None)
+
+class EchoSuppressor:
+    # 记录同步自身写入的文件(路径、大小、修改时间)，在有效期内丢弃与之匹配的回声事件
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._expiry = deque()  # (过期时间, 路径键)，按过期时间排序
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+    
+    def record(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        key = self._key(path)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (stat.st_size, stat.st_mtime_ns, expires)
+            self._expiry.append((expires, key))
+    
+    def _purge(self, now):
+        # 只从队首弹出已过期的记录；同一路径重新写入后旧的队列项不再删除记录
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, key = self._expiry.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == expires:
+                del self._entries[key]
+    
+    def paths(self):
+        with self._lock:
+            self._purge(time.monotonic())
+            return list(self._entries)
+    
+    def is_echo(self, path):
+        key = self._key(path)
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._entries.get(key)
+        
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == entry[:2]
+
+# 冲突队列中可用的批量处理方式
+CONFLICT_RULES = [
+    ("保留较新的文件", "newer"),
+    ("保留较大的文件", "larger"),
+    ("保留源文件", "source"),
+    ("保留目标文件", "destination"),
+    ("保留两者", "keep_both"),
+    ("忽略", "ignore"),
+]
+
+class ConflictQueue:
+    # 持久化的冲突队列：同步时冲突只入队，在冲突面板中批量决定后于下一次同步执行
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.entries = []
+        self._lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = []
+    
+    def save(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.file_path)
+    
+    def add(self, job_name, src_path, dest_path):
+        with self._lock:
+            for entry in self.entries:
+                if entry.get('job') == job_name and {entry['src'], entry['dest']} == {src_path, dest_path}:
+                    entry['src'], entry['dest'] = src_path, dest_path
+                    entry['detected'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    break
+            else:
+                self.entries.append({
+                    'id': uuid.uuid4().hex,
+                    'job': job_name,
+                    'src': src_path,
+                    'dest': dest_path,
+                    'detected': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'resolution': None
+                })
+            self.save()
+    
+    def set_resolution(self, entry_ids, resolution):
+        with self._lock:
+            for entry in self.entries:
+                if entry['id'] in entry_ids:
+                    entry['resolution'] = resolution
+            self.save()
+    
+    def resolved(self, job_name):
+        # 只返回该任务已决定的冲突；旧版本队列中的条目没有任务名，由调用方按路径判断归属
+        with self._lock:
+            return [dict(entry) for entry in self.entries
+                    if entry['resolution'] and entry.get('job') in (job_name, None)]
+    
+    def remove(self, entry_id):
+        # 冲突执行完成后才从队列中移除，执行失败的决定保留到下一次同步
+        with self._lock:
+            self.entries = [entry for entry in self.entries if entry['id'] != entry_id]
+            self.save()
+    
+    def pending_count(self):
+        return sum(1 for entry in self.entries if not entry['resolution'])
+
+# 未完成的操作重做失败达到此次数后放弃，避免每次同步都因同一操作失败
+REPLAY_MAX_ATTEMPTS = 3
+
+class EventJournal:
+    # 预写事件日志(追加写入的 JSON 行)：记录监控到的文件事件和进行中的复制操作。
+    # 启动时只需重放日志中的路径和未完成的操作；日志不完整时才需要完整扫描
+    def __init__(self, file_path, compact_threshold=1000):
+        self.file_path = file_path
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._events = {}      # 任务名 -> {路径: 序号}
+        self._ops = {}         # 操作ID -> 操作记录
+        self._incomplete = {}  # 任务名 -> 原因，'*' 表示所有任务
+        self._appended = 0
+        self._file = None
+        self.load()
+        self.compact()
+    
+    def load(self):
+        try:
+            f = open(self.file_path, 'r', encoding='utf-8')
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    # 日志损坏(例如崩溃时只写了一半)，无法确定丢失了哪些事件
+                    self._incomplete['*'] = "事件日志损坏"
+    
+    def _apply(self, record):
+        self._seq = max(self._seq, record['seq'])
+        kind = record['type']
+        if kind == 'event':
+            self._events.setdefault(record['job'], {})[record['path']] = record['seq']
+        elif kind == 'op':
+            self._ops[record['id']] = record
+        elif kind == 'done':
+            self._ops.pop(record['id'], None)
+        elif kind == 'synced':
+            events = self._events.get(record['job'], {})
+            paths = record.get('paths')
+            for path in list(events if paths is None else paths):
+                if events.get(path, record['upto'] + 1) <= record['upto']:
+                    del events[path]
+            if paths is None:
+                self._incomplete.pop(record['job'], None)
+        elif kind == 'incomplete':
+            self._incomplete[record['job']] = record['reason']
+    
+    def _append(self, record):
+        with self._lock:
+            self._seq += 1
+            record['seq'] = self._seq
+            self._apply(record)
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+            self._appended += 1
+            return self._seq
+    
+    def compact(self):
+        # 只保留未处理的事件、未完成的操作和不完整标记，原子替换日志文件
+        with self._lock:
+            records = [{'type': 'incomplete', 'job': job_name, 'reason': reason, 'seq': self._seq}
+                       for job_name, reason in self._incomplete.items()]
+            for job_name, events in self._events.items():
+                records.extend({'type': 'event', 'job': job_name, 'path': path, 'seq': seq}
+                               for path, seq in events.items())
+            records.extend(self._ops.values())
+            
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            tmp_path = self.file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file:
+                self._file.close()
+            os.replace(tmp_path, self.file_path)
+            self._file = open(self.file_path, 'a', encoding='utf-8')
+            self._appended = 0
+    
+    def mark(self):
+        with self._lock:
+            return self._seq
+    
+    def record_event(self, job_name, path):
+        self._append({'type': 'event', 'job': job_name, 'path': path})
+    
+    def mark_incomplete(self, job_name, reason):
+        self._append({'type': 'incomplete', 'job': job_name, 'reason': reason})
+    
+    def record_synced(self, job_name, upto, paths=None):
+        # 序号不大于 upto 的事件已被本次同步覆盖；paths 为 None 表示完整同步
+        record = {'type': 'synced', 'job': job_name, 'upto': upto}
+        if paths is not None:
+            record['paths'] = sorted(paths)
+        self._append(record)
+        if self._appended >= self.compact_threshold:
+            self.compact()
+    
+    def begin_op(self, job_name, **details):
+        op_id = uuid.uuid4().hex
+        self._append({'type': 'op', 'id': op_id, 'job': job_name, **details})
+        return op_id
+    
+    def end_op(self, op_id):
+        self._append({'type': 'done', 'id': op_id})
+    
+    def fail_op(self, op):
+        # 重放失败时重写操作记录并累加失败次数，返回累计次数
+        attempts = op.get('attempts', 0) + 1
+        self._append({**op, 'attempts': attempts})
+        return attempts
+    
+    def pending(self, job_name):
+        # 返回 (待同步路径, 未完成操作, 不完整原因)
+        with self._lock:
+            paths = list(self._events.get(job_name, {}))
+            ops = [op for op in self._ops.values() if op['job'] == job_name]
+            reason = self._incomplete.get(job_name) or self._incomplete.get('*')
+        return paths, ops, reason
+    
+    def clear_global_incomplete(self, job_names):
+        # 把“所有任务不完整”标记落实到每个任务上，由各任务的完整同步分别清除
+        with self._lock:
+            reason = self._incomplete.get('*')
+        if reason:
+            for job_name in job_names:
+                self.mark_incomplete(job_name, reason)
+            with self._lock:
+                self._incomplete.pop('*', None)
+            self.compact()
+    
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+# 内容定义分块参数：块边界由 gear 滚动哈希决定，平均约 8KB
+CHUNK_MIN_SIZE = 2 * 1024
+CHUNK_MAX_SIZE = 64 * 1024
+CHUNK_MASK = ((1 << 13) - 1) << 51
+GEAR_TABLE = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), 'little') for i in range(256)]
+# 逐字节计算滚动哈希在纯 Python 中只有几 MB/s，超过该大小的文件改用固定大小分块
+CHUNK_CDC_MAX_FILE_SIZE = 4 * 1024 * 1024
+CHUNK_FIXED_SIZE = 1024 * 1024
+
+def content_defined_chunks(data):
+    # 输出 (起点, 终点)；边界只取决于附近 64 字节的内容，插入或删除数据只影响相邻的块
+    size = len(data)
+    table, mask = GEAR_TABLE, CHUNK_MASK
+    start = 0
+    while start < size:
+        end = min(start + CHUNK_MAX_SIZE, size)
+        cut = end
+        position = start + CHUNK_MIN_SIZE
+        if position < end:
+            h = 0
+            for byte in data[position - 64:position]:
+                h = ((h << 1) + table[byte]) & 0xFFFFFFFFFFFFFFFF
+            for offset, byte in enumerate(data[position:end], position + 1):
+                h = ((h << 1) + table[byte]) & 0xFFFFFFFFFFFFFFFF
+                if not h & mask:
+                    cut = offset
+                    break
+        yield start, cut
+        start = cut
+
+def version_chunks(data):
+    # 小文件按内容定义分块；大文件按固定大小分块，原地修改的部分仍能去重
+    size = len(data)
+    if size <= CHUNK_CDC_MAX_FILE_SIZE:
+        return content_defined_chunks(data)
+    return ((start, min(start + CHUNK_FIXED_SIZE, size)) for start in range(0, size, CHUNK_FIXED_SIZE))
+
+class VersionStore:
+    # 版本库：文件被覆盖前的内容按内容定义分块，去重后存入 chunks/ 目录，
+    # 每个文件的版本列表(块哈希序列)保存在 versions.json 中
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'versions.json')
+        self.keep_versions = 10  # 每个文件保留的版本数，0 为不限
+        self.keep_days = 30  # 版本保留天数，0 为不限
+        self.files = {}
+        self.chunks = {}  # 块哈希 -> 大小
+        self.added = None  # 设为列表时记录本实例新保存的 (路径, 版本)，供分片同步合并
+        self._dirty = False
+        self._lock = threading.Lock()
+        # 保存版本与垃圾回收互斥，避免刚被复用的块在登记版本前被回收
+        self._gc_lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.files, self.chunks = data['files'], data['chunks']
+        except (OSError, ValueError, KeyError):
+            self.files, self.chunks = {}, {}
+    
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({'files': self.files, 'chunks': self.chunks}, ensure_ascii=False)
+            self._dirty = False
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+    
+    def _chunk_path(self, digest):
+        return os.path.join(self.root, 'chunks', digest[:2], digest)
+    
+    def _store_chunk(self, digest, chunk):
+        # 返回新写入的字节数；已有的块不再重复保存
+        with self._lock:
+            if digest in self.chunks:
+                return 0
+        chunk_path = self._chunk_path(digest)
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        tmp_path = f"{chunk_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(chunk)
+            os.replace(tmp_path, chunk_path)
+        except OSError:
+            # 写入失败(如磁盘已满)时不登记，之后的版本不会引用不存在的块
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            # 其他任务可能同时写入了相同的块
+            if digest in self.chunks:
+                return 0
+            self.chunks[digest] = len(chunk)
+        return len(chunk)
+    
+    def save_version(self, path):
+        # 保存文件当前内容为一个新版本，返回新写入的字节数；与最新版本相同时返回 None。
+        # 分块和计算哈希不持锁，多个任务可以并行；只有写入块和登记版本与垃圾回收互斥
+        path = os.path.abspath(path)
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if not stat.st_size:
+                return self._save_version(path, stat, b'', [])
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                spans = [(hashlib.blake2b(data[start:end], digest_size=20).hexdigest(), start, end)
+                         for start, end in version_chunks(data)]
+                return self._save_version(path, stat, data, spans)
+    
+    def _save_version(self, path, stat, data, spans):
+        chunks = [digest for digest, _, _ in spans]
+        with self._gc_lock:
+            stored = sum(self._store_chunk(digest, data[start:end]) for digest, start, end in spans)
+            return self._register_version(path, stat, chunks, stored)
+    
+    def _register_version(self, path, stat, chunks, stored):
+        with self._lock:
+            versions = self.files.setdefault(path, [])
+            if versions and versions[-1]['chunks'] == chunks and versions[-1]['mtime_ns'] == stat.st_mtime_ns:
+                return None
+            versions.append({
+                'saved': time.time(),
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'chunks': chunks
+            })
+            if self.added is not None:
+                self.added.append((path, versions[-1]))
+            self._dirty = True
+        return stored
+    
+    def merge(self, added, chunks):
+        # 合并其他进程(分片同步的工作进程)保存的版本，chunks 为这些版本引用的块哈希 -> 大小
+        with self._gc_lock, self._lock:
+            for path, version in added:
+                self.files.setdefault(path, []).append(version)
+            for digest, size in chunks.items():
+                self.chunks.setdefault(digest, size)
+            if added:
+                self._dirty = True
+    
+    def versions(self, path):
+        with self._lock:
+            return list(self.files.get(os.path.abspath(path), []))
+    
+    def restore(self, path, number=None, output_path=None):
+        # 把第 number 个版本(从 1 开始，默认最新)写到 output_path(默认原路径)；
+        # 覆盖已有文件前先保存其当前内容，恢复操作本身也可撤销
+        versions = self.versions(path)
+        if not versions:
+            raise ValueError(f"没有 {path} 的历史版本")
+        if number is None:
+            number = len(versions)
+        if not 1 <= number <= len(versions):
+            raise ValueError(f"版本号应在 1 到 {len(versions)} 之间")
+        version = versions[number - 1]
+        output_path = os.path.abspath(output_path or path)
+        
+        if os.path.isfile(output_path):
+            self.save_version(output_path)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        tmp_path = output_path + '.restore.tmp'
+        with open(tmp_path, 'wb') as out:
+            for digest in version['chunks']:
+                with open(self._chunk_path(digest), 'rb') as f:
+                    out.write(f.read())
+        os.utime(tmp_path, ns=(version['mtime_ns'], version['mtime_ns']))
+        os.replace(tmp_path, output_path)
+        self.save()
+        return version
+    
+    def apply_retention(self):
+        # 按保留版本数和保留天数删除旧版本，返回删除的版本数
+        cutoff = time.time() - self.keep_days * 86400 if self.keep_days else None
+        removed = 0
+        with self._lock:
+            for path in list(self.files):
+                versions = self.files[path]
+                kept = versions[-self.keep_versions:] if self.keep_versions else versions
+                if cutoff is not None:
+                    kept = [version for version in kept if version['saved'] >= cutoff]
+                if len(kept) != len(versions):
+                    removed += len(versions) - len(kept)
+                    self._dirty = True
+                    if kept:
+                        self.files[path] = kept
+                    else:
+                        del self.files[path]
+        return removed
+    
+    def gc(self):
+        # 删除不再被任何版本引用的块(包括崩溃时遗留的未登记块)，返回释放的字节数。
+        # 未登记的块可能是其他进程刚写入、尚未合并的，只删除一小时前的
+        freed = 0
+        cutoff = time.time() - 3600
+        with self._gc_lock:
+            with self._lock:
+                referenced = {digest for versions in self.files.values()
+                              for version in versions for digest in version['chunks']}
+                for digest in [digest for digest in self.chunks if digest not in referenced]:
+                    freed += self.chunks.pop(digest)
+                    self._dirty = True
+                known = set(self.chunks)
+            
+            chunk_root = os.path.join(self.root, 'chunks')
+            if os.path.isdir(chunk_root):
+                for prefix in os.listdir(chunk_root):
+                    prefix_dir = os.path.join(chunk_root, prefix)
+                    for name in os.listdir(prefix_dir):
+                        if name not in known:
+                            chunk_path = os.path.join(prefix_dir, name)
+                            try:
+                                if os.path.getmtime(chunk_path) < cutoff:
+                                    os.remove(chunk_path)
+                            except OSError:
+                                pass
+        self.save()
+        return freed
+    
+    def stats(self):
+        # 返回 (版本数, 原始字节数, 实际占用字节数)
+        with self._lock:
+            count = sum(len(versions) for versions in self.files.values())
+            logical = sum(version['size'] for versions in self.files.values() for version in versions)
+            stored = sum(self.chunks.values())
+        return count, logical, stored
+    
+    def summary(self):
+        count, logical, stored = self.stats()
+        ratio = logical / stored if stored else 1.0
+        return (f"{count} 个版本, 原始 {logical / 1024 / 1024:.1f}MB, "
+                f"占用 {stored / 1024 / 1024:.1f}MB, 去重率 {ratio:.2f}x")
+
+class IOBudget:
+    # 全局I/O预算(字节/秒)，所有任务共享；rate 为 0 表示不限速
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._available = 0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+            self._available = 0
+            self._last = time.monotonic()
+    
+    def consume(self, nbytes):
+        if not self.rate or nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.rate, self._available + (now - self._last) * self.rate)
+            self._last = now
+            # 允许透支，调用方按先后顺序等待偿还
+            self._available -= nbytes
+            wait = -self._available / self.rate if self._available < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+class SyncJob:
+    # 命名同步任务：拥有独立的路径、同步方向、过滤条件、冲突策略和同步间隔
+    def __init__(self, name, sync_paths=None, sync_direction="bidirectional",
+                 conflict_resolution="newer", file_filters=None, interval=60, watch_mode="recursive"):
+        self.name = name
+        self.sync_paths = list(sync_paths or [])
+        self.sync_direction = sync_direction  # bidirectional, source_to_dest, dest_to_source
+        self.conflict_resolution = conflict_resolution  # newer, larger, ask
+        self.file_filters = file_filters or {
+            'extensions': [],
+            'min_size': 0,
+            'max_size': 0,
+            'exclude_hidden': True
+        }
+        self.interval = interval
+        self.watch_mode = watch_mode  # recursive, hybrid
+        
+        # 运行状态
+        self.status = "空闲"
+        self.last_sync_time = None
+        self.last_status = ""
+        self.monitoring = False
+        self.timer = None
+        self.watches = []
+        self.watcher = None  # 混合监控模式下的 HybridWatcher
+        self.watch_info = ""  # 监控数量和注册用时
+        self.watches_lost = False  # 监控线程已退出，之后的事件会丢失
+        self.scan_cache = DirectoryScanCache()
+        self.event_metrics = Counter()  # 上次运行以来监控事件的统计，计入下一条历史记录
+        self.requeued = []  # 校验不一致或扇出复制失败、需要在下次同步时重新复制的 (源, 目标)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'sync_paths': self.sync_paths,
+            'sync_direction': self.sync_direction,
+            'conflict_resolution': self.conflict_resolution,
+            'file_filters': self.file_filters,
+            'interval': self.interval,
+            'watch_mode': self.watch_mode
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data.get('sync_paths'), data.get('sync_direction', "bidirectional"),
+                   data.get('conflict_resolution', "newer"), data.get('file_filters'), data.get('interval', 60),
+                   data.get('watch_mode', "recursive"))
+
+class JobScheduler:
+    # 所有任务共享一个线程池，按轮转顺序公平调度；
+    # 同一任务同时只运行一次，运行期间的重复请求合并为结束后的一次
+    def __init__(self, run_job, max_workers=4):
+        self.run_job = run_job
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='sync-worker')
+        self._ready = deque()
+        self._running = set()
+        self._requests = {}  # 任务 -> 待同步路径集合，None 表示完整同步
+        self._lock = threading.Lock()
+    
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self.max_workers = max_workers
+            self._dispatch()
+    
+    def submit(self, job, targets=None):
+        # targets 为 None 表示完整同步，否则只同步给定路径；排队中的请求会被合并
+        with self._lock:
+            queued = job in self._requests
+            if targets is None or (queued and self._requests[job] is None):
+                self._requests[job] = None
+            else:
+                self._requests.setdefault(job, set()).update(targets)
+            if queued or job in self._running:
+                return False
+            job.status = "等待中"
+            self._ready.append(job)
+            self._dispatch()
+        return True
+    
+    def _dispatch(self):
+        while self._ready and len(self._running) < self.max_workers:
+            job = self._ready.popleft()
+            self._running.add(job)
+            self.executor.submit(self._run, job, self._requests.pop(job))
+    
+    def is_queued(self, job):
+        with self._lock:
+            return job in self._requests
+    
+    def _run(self, job, targets):
+        try:
+            self.run_job(job, targets)
+        finally:
+            with self._lock:
+                self._running.discard(job)
+                if job in self._requests:
+                    # 运行期间又有新请求，排到队尾，保证各任务轮流执行
+                    job.status = "等待中"
+                    self._ready.append(job)
+                self._dispatch()
+    
+    def shutdown(self):
+        with self._lock:
+            self._ready.clear()
+            self._requests.clear()
+        self.executor.shutdown(wait=False)
+
+class SyncRun:
+    # 一次同步运行的上下文：本次指标、写入的文件和校验结果
+    def __init__(self, job):
+        self.job = job
+        self.metrics = Counter()
+        self.copied = []
+        self.verify_mismatches = []
+
+class SyncEngine:
+    # 同步引擎：负责扫描、比较和复制，不依赖界面，可被多个任务并发调用
+    def __init__(self, log, conflict_queue, io_budget, journal=None):
+        self.log = log
+        self.conflict_queue = conflict_queue
+        self.io_budget = io_budget
+        self.journal = journal
+        self.mtime_trust_window = 2  # 秒
+        self.verify_mode = "off"  # off, all, sample
+        self.verify_percent = 10
+        self.verify_min_size = 0  # 字节，抽样模式下超过该大小的文件总是校验
+        self.verify_pool = None
+        self._verify_lock = threading.Lock()
+        self.version_store = None  # 启用版本备份时为 VersionStore，覆盖文件前先保存旧内容
+        self.sharding = False  # 多进程分片同步
+        self.shard_count = os.cpu_count() or 1
+        self.shard_pool = None
+        self._shard_pool_size = 0
+        self._shard_lock = threading.Lock()
+        self.echo_suppressor = EchoSuppressor()
+        self.small_file_copier = SmallFileCopier()
+        # 大文件目标路径 -> 上次由同步写入后的 (大小, 修改时间ns)，用于判断能否只追加尾部
+        self._tail_state = {}
+        self.metrics = {
+            'echo_events_dropped': 0,
+            'sync_passes_avoided': 0
+        }
+    
+    def file_passes_filters(self, file_path, file_filters, file_size=None):
+        # 检查扩展名
+        if file_filters['extensions']:
+            ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+            if ext not in file_filters['extensions']:
+                return False
+        
+        # 检查文件大小(已知大小时不再读取文件状态，例如来自清单)
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        if file_filters['min_size'] and file_size < file_filters['min_size']:
+            return False
+        if file_filters['max_size'] and file_size > file_filters['max_size']:
+            return False
+        
+        # 检查隐藏文件
+        if file_filters['exclude_hidden'] and os.path.basename(file_path).startswith('.'):
+            return False
+        
+        return True
+    
+    def resolve_conflict(self, job, src_path, dest_path):
+        conflict_resolution = job.conflict_resolution
+        if conflict_resolution == "ask":
+            # 不再弹出模态对话框，冲突入队后继续同步
+            src_stat = os.stat(src_path)
+            dest_stat = os.stat(dest_path)
+            if (src_stat.st_mtime, src_stat.st_size) != (dest_stat.st_mtime, dest_stat.st_size):
+                self.conflict_queue.add(job.name, src_path, dest_path)
+                self.log(f"冲突已加入队列: {src_path} <-> {dest_path}")
+            return "skip"
+        elif conflict_resolution == "newer":
+            src_mtime = os.path.getmtime(src_path)
+            dest_mtime = os.path.getmtime(dest_path)
+            return "source" if src_mtime > dest_mtime else "destination"
+        else:  # larger
+            src_size = os.path.getsize(src_path)
+            dest_size = os.path.getsize(dest_path)
+            return "source" if src_size > dest_size else "destination"
+    
+    def apply_conflict_resolutions(self, run):
+        file_count = 0
+        for entry in self.conflict_queue.resolved(run.job.name):
+            if 'job' not in entry and not all(self._under_roots(run.job.sync_paths, path)
+                                              for path in (entry['src'], entry['dest'])):
+                continue
+            try:
+                file_count += self.apply_conflict_resolution(entry, run)
+            except OSError as e:
+                self.log(f"执行冲突决定失败: {entry['src']} <-> {entry['dest']} ({str(e)})")
+                continue
+            self.conflict_queue.remove(entry['id'])
+        return file_count
+    
+    def apply_conflict_resolution(self, entry, run):
+        src_path, dest_path, rule = entry['src'], entry['dest'], entry['resolution']
+        if rule == "ignore" or not (os.path.exists(src_path) and os.path.exists(dest_path)):
+            return 0
+        
+        if rule == "newer":
+            rule = "source" if os.path.getmtime(src_path) > os.path.getmtime(dest_path) else "destination"
+        elif rule == "larger":
+            rule = "source" if os.path.getsize(src_path) > os.path.getsize(dest_path) else "destination"
+        
+        if rule == "keep_both":
+            # 目标文件另存为冲突副本后再用源文件覆盖
+            stem, ext = os.path.splitext(dest_path)
+            backup_path = f"{stem}.conflict-{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
+            self.copy_file(dest_path, backup_path, run)
+            self.copy_file(src_path, dest_path, run)
+            self.log(f"同步文件(冲突队列): 保留两者，{dest_path} 另存为 {backup_path}")
+        elif rule == "source":
+            self.copy_file(src_path, dest_path, run)
+            self.log(f"同步文件(冲突队列): 从 {src_path} 到 {dest_path}")
+        else:
+            self.copy_file(dest_path, src_path, run)
+            self.log(f"同步文件(冲突队列): 从 {dest_path} 到 {src_path}")
+        return 1
+    
+    def keep_version(self, path, run):
+        # 目标文件即将被覆盖时把其当前内容存入版本库；保存失败时抛出异常，不覆盖文件
+        if self.version_store is None or not os.path.isfile(path):
+            return
+        stored = self.version_store.save_version(path)
+        if stored is not None:
+            run.metrics['versions_saved'] += 1
+            run.metrics['version_bytes_stored'] += stored
+    
+    def commit_versions(self, run):
+        # 每次运行结束后保存版本索引并按保留策略清理
+        if self.version_store is None or not run.metrics['versions_saved']:
+            return
+        try:
+            if self.version_store.apply_retention():
+                self.version_store.gc()
+            self.version_store.save()
+        except OSError as e:
+            self.log(f"[{run.job.name}] 无法保存版本库: {str(e)}")
+    
+    def record_tail_state(self, dest_path):
+        try:
+            stat = os.stat(dest_path)
+        except OSError:
+            return
+        if stat.st_size >= TAIL_MIN_SIZE:
+            self._tail_state[dest_path] = (stat.st_size, stat.st_mtime_ns)
+    
+    def copy_tail(self, src_path, dest_path, stat, run):
+        # 目标自上次同步写入后未被改动、且源文件只在末尾追加时，只传输新增部分；返回是否已完成
+        state = self._tail_state.get(dest_path)
+        if state is None or stat.st_size < TAIL_MIN_SIZE:
+            return False
+        try:
+            dest_stat = os.stat(dest_path)
+        except OSError:
+            return False
+        if (dest_stat.st_size, dest_stat.st_mtime_ns) != state:
+            return False
+        
+        if self.journal:
+            op_id = self.journal.begin_op(run.job.name, kind='copy', src=src_path, dest=dest_path)
+        appended = append_tail(src_path, dest_path)
+        if self.journal:
+            self.journal.end_op(op_id)
+        if appended is None:
+            return False
+        
+        self.io_budget.consume(appended)
+        run.metrics['tail_appends'] += 1
+        run.metrics['tail_bytes_saved'] += dest_stat.st_size
+        self.echo_suppressor.record(dest_path)
+        self.record_tail_state(dest_path)
+        if self.verify_mode != "off":
+            run.copied.append((src_path, dest_path))
+        return True
+    
+    def copy_file(self, src_path, dest_path, run):
+        stat = os.stat(src_path)
+        # 只追加增长的文件没有内容被覆盖，不需要保存旧版本
+        if self.copy_tail(src_path, dest_path, stat, run):
+            return
+        self.keep_version(dest_path, run)
+        if self.journal:
+            op_id = self.journal.begin_op(run.job.name, kind='copy', src=src_path, dest=dest_path)
+        if SPARSE_COPY_SUPPORTED and is_sparse_file(src_path, stat):
+            self.io_budget.consume(stat.st_blocks * 512)
+            run.metrics['sparse_bytes_skipped'] += sparse_copy(src_path, dest_path)
+            run.metrics['sparse_files_copied'] += 1
+        else:
+            self.io_budget.consume(stat.st_size)
+            shutil.copy2(src_path, dest_path)
+        if self.journal:
+            self.journal.end_op(op_id)
+        self.echo_suppressor.record(dest_path)
+        self.record_tail_state(dest_path)
+        if self.verify_mode != "off":
+            run.copied.append((src_path, dest_path))
+    
+    def copy_file_fanout(self, src_path, dest_paths, run):
+        # 同一源文件复制到多个目标时只读取一次；返回成功复制的目标列表。
+        # 失败的目标不影响其他目标，记录日志后在下次同步时重新复制
+        if len(dest_paths) == 1:
+            self.copy_file(src_path, dest_paths[0], run)
+            return list(dest_paths)
+        stat = os.stat(src_path)
+        if SPARSE_COPY_SUPPORTED and is_sparse_file(src_path, stat):
+            for dest_path in dest_paths:
+                self.copy_file(src_path, dest_path, run)
+            return list(dest_paths)
+        
+        # 只追加增长的目标单独追加尾部，其余目标一起完整复制；追加失败的目标与扇出失败同样处理
+        appended, remaining = [], []
+        for dest_path in dest_paths:
+            try:
+                if self.copy_tail(src_path, dest_path, stat, run):
+                    appended.append(dest_path)
+                    continue
+            except OSError as e:
+                run.job.requeued.append((src_path, dest_path))
+                run.metrics['fanout_failures'] += 1
+                self.log(f"复制失败: 从 {src_path} 到 {dest_path}: {e}")
+                continue
+            remaining.append(dest_path)
+        dest_paths = remaining
+        if len(dest_paths) < 2:
+            for dest_path in dest_paths:
+                self.copy_file(src_path, dest_path, run)
+            return appended + dest_paths
+        
+        for dest_path in dest_paths:
+            self.keep_version(dest_path, run)
+        if self.journal:
+            op_id = self.journal.begin_op(run.job.name, kind='fanout', src=src_path, dests=list(dest_paths))
+        self.io_budget.consume(stat.st_size * len(dest_paths))
+        failures = fanout_copy(src_path, dest_paths)
+        if self.journal:
+            self.journal.end_op(op_id)
+        
+        copied = []
+        for dest_path in dest_paths:
+            error = failures.get(dest_path)
+            if error is not None:
+                run.job.requeued.append((src_path, dest_path))
+                run.metrics['fanout_failures'] += 1
+                self.log(f"复制失败: 从 {src_path} 到 {dest_path}: {error}")
+                continue
+            self.echo_suppressor.record(dest_path)
+            self.record_tail_state(dest_path)
+            if self.verify_mode != "off":
+                run.copied.append((src_path, dest_path))
+            copied.append(dest_path)
+        run.metrics['fanout_reads_saved'] += len(dest_paths) - 1
+        return appended + copied
+    
+    def copy_small_files(self, src_dir, dest_dirs, files, run):
+        # files 为 [(文件名, 大小)]，同一目录下的小文件一起复制到所有目标目录；返回复制的文件数
+        names = [name for name, _ in files]
+        for dest_dir in dest_dirs:
+            for name in names:
+                self.keep_version(os.path.join(dest_dir, name), run)
+        if self.journal:
+            op_id = self.journal.begin_op(run.job.name, kind='batch', src=src_dir, dests=list(dest_dirs), names=names)
+        self.io_budget.consume(sum(size for _, size in files) * len(dest_dirs))
+        if DIR_FD_SUPPORTED:
+            copied, failed = self.small_file_copier.copy_batch(src_dir, dest_dirs, names)
+        else:
+            copied, failed = [], [(dest_dir, name) for dest_dir in dest_dirs for name in names]
+        
+        for dest_dir, name in copied:
+            self.echo_suppressor.record(os.path.join(dest_dir, name))
+            if self.verify_mode != "off":
+                run.copied.append((os.path.join(src_dir, name), os.path.join(dest_dir, name)))
+        for dest_dir, name in failed:
+            self.copy_file(os.path.join(src_dir, name), os.path.join(dest_dir, name), run)
+        if self.journal:
+            self.journal.end_op(op_id)
+        
+        run.metrics['small_files_copied'] += len(copied)
+        self.log(f"同步小文件: {len(names)} 个, 从 {src_dir} 到 {', '.join(dest_dirs)}")
+        return len(names) * len(dest_dirs)
+    
+    def verify_copies(self, run):
+        # 复制阶段结束后比较源和目标的校验和，不一致的文件在下次同步时重新复制
+        if self.verify_mode == "off" or not run.copied:
+            return
+        
+        pairs = []
+        for src_path, dest_path in run.copied:
+            if self.verify_mode == "sample":
+                try:
+                    size = os.path.getsize(src_path)
+                except OSError:
+                    continue
+                if not ((self.verify_min_size and size >= self.verify_min_size)
+                        or random.random() * 100 < self.verify_percent):
+                    continue
+            pairs.append((src_path, dest_path))
+        if not pairs:
+            return
+        
+        # 多个任务线程可能同时校验，只创建一个进程池
+        with self._verify_lock:
+            if self.verify_pool is None:
+                self.verify_pool = ProcessPoolExecutor()
+            pool = self.verify_pool
+        futures = [(src_path, dest_path,
+                    pool.submit(file_checksum, src_path),
+                    pool.submit(file_checksum, dest_path))
+                   for src_path, dest_path in pairs]
+        
+        for src_path, dest_path, src_future, dest_future in futures:
+            try:
+                matched = src_future.result() == dest_future.result()
+            except OSError as e:
+                self.log(f"校验失败: {dest_path} ({str(e)})")
+                continue
+            run.metrics['verify_checked'] += 1
+            if not matched:
+                run.metrics['verify_mismatches'] += 1
+                run.verify_mismatches.append(dest_path)
+                run.job.requeued.append((src_path, dest_path))
+                self.log(f"校验不一致，已加入重新复制队列: {dest_path}")
+    
+    def replay_unfinished_ops(self, run):
+        # 重做上次崩溃或失败时未完成的复制操作；返回复制的文件数
+        if not self.journal:
+            return 0
+        file_count = 0
+        for op in self.journal.pending(run.job.name)[1]:
+            # 旧版本日志中的批量操作只有单个 dest
+            dests = op.get('dests') or [op['dest']]
+            if not all(self._under_roots(run.job.sync_paths, path) for path in [op['src'], *dests]):
+                # 任务的同步路径已修改，操作涉及的路径不再属于该任务
+                self.log(f"[{run.job.name}] 丢弃不属于当前同步路径的未完成操作: {op['src']}")
+                self.journal.end_op(op['id'])
+                continue
+            mark = self.journal.mark()
+            try:
+                file_count += self.replay_op(op, dests, run)
+            except OSError as e:
+                # 重做时失败的复制会留下新的操作记录，只保留原操作并累加失败次数
+                for stale in self.journal.pending(run.job.name)[1]:
+                    if stale['seq'] > mark:
+                        self.journal.end_op(stale['id'])
+                attempts = self.journal.fail_op(op)
+                if attempts < REPLAY_MAX_ATTEMPTS:
+                    self.log(f"[{run.job.name}] 重做未完成操作失败(第 {attempts} 次): {op['src']} ({str(e)})")
+                    continue
+                self.log(f"[{run.job.name}] 重做未完成操作连续失败 {attempts} 次，已放弃: {op['src']} ({str(e)})")
+            self.journal.end_op(op['id'])
+            run.metrics['journal_ops_replayed'] += 1
+        return file_count
+    
+    def replay_op(self, op, dests, run):
+        if op['kind'] == 'copy':
+            if not os.path.isfile(op['src']):
+                return 0
+            os.makedirs(os.path.dirname(op['dest']), exist_ok=True)
+            self.copy_file(op['src'], op['dest'], run)
+            return 1
+        if op['kind'] == 'fanout':
+            if not os.path.isfile(op['src']):
+                return 0
+            for dest_path in dests:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            return len(self.copy_file_fanout(op['src'], dests, run))
+        if not os.path.isdir(op['src']):
+            return 0
+        for dest_dir in dests:
+            os.makedirs(dest_dir, exist_ok=True)
+        files = [(name, os.path.getsize(os.path.join(op['src'], name)))
+                 for name in op['names'] if os.path.isfile(os.path.join(op['src'], name))]
+        return self.copy_small_files(op['src'], dests, files, run) if files else 0
+    
+    def _under_roots(self, sync_paths, path):
+        return any(path == root or path.startswith(os.path.join(root, '')) for root in sync_paths)
+    
+    def _rel_path(self, sync_paths, path):
+        # 把事件路径换算成相对于同步根的路径；文件根对应其文件名
+        for root in sync_paths:
+            if path == root:
+                return os.path.basename(root) if os.path.isfile(root) else None
+            if path.startswith(os.path.join(root, '')):
+                return os.path.relpath(path, root)
+        return None
+    
+    def _locations(self, sync_paths, rel_path):
+        # 某个相对路径在各个根中的对应位置。文件根不论文件名都代表同一个顶层条目：
+        # 相对路径是任一文件根的文件名时，所有文件根都参与
+        dir_roots = [root for root in sync_paths if os.path.isdir(root)]
+        file_roots = [root for root in sync_paths if os.path.isfile(root)]
+        return self._merged_locations(sync_paths, rel_path, dir_roots, file_roots)
+    
+    def _merged_locations(self, sync_paths, rel_path, dir_roots, file_roots):
+        file_entry = any(os.path.basename(root) == rel_path for root in file_roots)
+        locations = []
+        for root in sync_paths:
+            if root in dir_roots:
+                locations.append((root, os.path.join(root, rel_path)))
+            elif root in file_roots and file_entry:
+                locations.append((root, root))
+        return locations
+    
+    def sync_entry(self, job, rel_path, run, locations=None, small_batches=None):
+        # 只同步一个相对路径，规则与完整同步相同；返回复制的文件数。
+        # locations 可由调用方预先算好；传入 small_batches 时小文件只登记到批次中，由调用方统一复制
+        file_count = 0
+        if job.sync_direction in ["source_to_dest", "dest_to_source"]:
+            source_idx = 0 if job.sync_direction == "source_to_dest" else 1
+            dest_idx = 1 if job.sync_direction == "source_to_dest" else 0
+            # 两个根都是文件时直接对应，与完整同步的文件同步相同
+            root_locations = dict(self._locations(job.sync_paths, rel_path))
+            src_path = root_locations.get(job.sync_paths[source_idx])
+            dest_path = root_locations.get(job.sync_paths[dest_idx])
+            if src_path is None or dest_path is None:
+                return 0
+            
+            if os.path.isfile(src_path) and self.file_passes_filters(src_path, job.file_filters):
+                if not os.path.exists(dest_path) or os.path.getmtime(src_path) > os.path.getmtime(dest_path):
+                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                    self.copy_file(src_path, dest_path, run)
+                    file_count += 1
+                    self.log(f"同步文件: 从 {src_path} 到 {dest_path}")
+            return file_count
+        
+        if locations is None:
+            locations = self._locations(job.sync_paths, rel_path)
+        existing = [path for _, path in locations
+                    if os.path.isfile(path) and self.file_passes_filters(path, job.file_filters)]
+        if not existing:
+            return 0
+        newest = max(existing, key=os.path.getmtime)
+        
+        # 需要更新的目录根副本一起复制，源文件只读取一次
+        stale = []
+        for root, path in locations:
+            if path != newest and os.path.isdir(root):
+                if not os.path.exists(path) or os.path.getmtime(newest) > os.path.getmtime(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    stale.append(path)
+        if stale:
+            size = os.path.getsize(newest)
+            # 批量复制按源文件名写入目标目录；文件根与不同名的条目对应时逐个路径复制
+            name = os.path.basename(newest)
+            if (small_batches is not None and size < SMALL_FILE_THRESHOLD
+                    and all(os.path.basename(path) == name for path in stale)):
+                batch_key = (os.path.dirname(newest), tuple(os.path.dirname(path) for path in stale))
+                small_batches.setdefault(batch_key, []).append((name, size))
+            else:
+                for path in self.copy_file_fanout(newest, stale, run):
+                    file_count += 1
+                    self.log(f"同步文件: 从 {newest} 到 {path}")
+        
+        for root, path in locations:
+            if path == newest or os.path.isdir(root):
+                continue
+            newest_stat, stat = os.stat(newest), os.stat(path)
+            if (newest_stat.st_mtime_ns, newest_stat.st_size) == (stat.st_mtime_ns, stat.st_size):
+                # 已经一致(例如同一次同步中已经复制过)，不再按冲突处理
+                continue
+            resolution = self.resolve_conflict(job, newest, path)
+            if resolution == "source":
+                self.copy_file(newest, path, run)
+                file_count += 1
+                self.log(f"同步文件(冲突解决): 从 {newest} 到 {path}")
+            elif resolution == "destination":
+                self.copy_file(path, newest, run)
+                file_count += 1
+                self.log(f"同步文件(冲突解决): 从 {path} 到 {newest}")
+        return file_count
+    
+    def _sync_one_way_files(self, job, run, src_dir, dest_dir, files):
+        # 单向同步一个目录中的文件，小文件批量复制；返回复制的文件数
+        file_count = 0
+        small_files = []
+        for file in files:
+            src_file = os.path.join(src_dir, file)
+            if self.file_passes_filters(src_file, job.file_filters):
+                dest_file = os.path.join(dest_dir, file)
+                
+                if not os.path.exists(dest_file) or os.path.getmtime(src_file) > os.path.getmtime(dest_file):
+                    size = os.path.getsize(src_file)
+                    if size < SMALL_FILE_THRESHOLD:
+                        small_files.append((file, size))
+                        continue
+                    self.copy_file(src_file, dest_file, run)
+                    file_count += 1
+                    self.log(f"同步文件: 从 {src_file} 到 {dest_file}")
+        
+        if small_files:
+            file_count += self.copy_small_files(src_dir, [dest_dir], small_files, run)
+        return file_count
+    
+    def sync_one_way(self, job, run, shard=None):
+        # 单向同步两个目录；shard 为分片同步时分配的 (目录列表, 文件列表)，为 None 时同步整个目录树
+        source_idx = 0 if job.sync_direction == "source_to_dest" else 1
+        source = job.sync_paths[source_idx]
+        destination = job.sync_paths[1 - source_idx]
+        top_dirs, top_files = shard or ([''], [])
+        file_count = 0
+        
+        grouped = {}
+        for rel_path in top_files:
+            grouped.setdefault(os.path.dirname(rel_path), []).append(os.path.basename(rel_path))
+        for rel_dir, files in sorted(grouped.items()):
+            dest_dir = os.path.join(destination, rel_dir)
+            os.makedirs(dest_dir, exist_ok=True)
+            file_count += self._sync_one_way_files(job, run, os.path.join(source, rel_dir), dest_dir, files)
+        
+        for top in top_dirs:
+            for root, _, files in job.scan_cache.walk(os.path.join(source, top) if top else source,
+                                                      self.mtime_trust_window, run.metrics):
+                rel_path = os.path.relpath(root, source)
+                dest_dir = os.path.join(destination, rel_path)
+                
+                if not os.path.exists(dest_dir):
+                    os.makedirs(dest_dir)
+                
+                file_count += self._sync_one_way_files(job, run, root, dest_dir, files)
+        return file_count
+    
+    def _list_merged(self, job, run, roots, rel_dir):
+        # 合并同一相对目录在各个根中的列表，返回 (子目录集合, 文件名集合)
+        subdirs, names = set(), set()
+        for root in roots:
+            listing = job.scan_cache.list_dir(os.path.join(root, rel_dir) if rel_dir else root,
+                                              self.mtime_trust_window, run.metrics)
+            if listing is not None:
+                subdirs.update(listing[0])
+                names.update(listing[1])
+        return subdirs, names
+    
+    def _sync_merged_names(self, job, run, rel_dir, names, dir_roots, file_roots):
+        # 双向同步一个目录中合并后的文件名，小文件批量复制；返回复制的文件数
+        file_count = 0
+        small_batches = {}
+        for name in sorted(names):
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            locations = self._merged_locations(job.sync_paths, rel_path, dir_roots, file_roots)
+            file_count += self.sync_entry(job, rel_path, run, locations, small_batches)
+        for (src_dir, dest_dirs), small_files in small_batches.items():
+            file_count += self.copy_small_files(src_dir, list(dest_dirs), small_files, run)
+        return file_count
+    
+    def sync_bidirectional(self, job, run, shard=None):
+        # 流式双向同步：各个根按相同的排序顺序逐目录遍历，把同一目录在各根中的列表按名称合并，
+        # 每解析完一个目录就立即执行复制。内存只与目录宽度有关，复制与扫描交替进行。
+        # shard 为分片同步时分配的 (目录列表, 文件列表)，为 None 时同步整个目录树
+        dir_roots = [path for path in job.sync_paths if os.path.isdir(path)]
+        file_roots = [path for path in job.sync_paths if os.path.isfile(path)]
+        file_count = 0
+        if shard is None:
+            pending = ['']
+        else:
+            grouped = {}
+            for rel_path in shard[1]:
+                grouped.setdefault(os.path.dirname(rel_path), []).append(os.path.basename(rel_path))
+            for rel_dir, names in sorted(grouped.items()):
+                file_count += self._sync_merged_names(job, run, rel_dir, names, dir_roots, file_roots)
+            pending = sorted(shard[0], key=manifest_sort_key, reverse=True)
+        
+        while pending:
+            rel_dir = pending.pop()
+            subdirs, names = self._list_merged(job, run, dir_roots, rel_dir)
+            if not rel_dir:
+                names.update(os.path.basename(path) for path in file_roots)
+            file_count += self._sync_merged_names(job, run, rel_dir, names, dir_roots, file_roots)
+            
+            # 子目录同样按名称排序，逆序压栈以保证按排序顺序深度优先处理
+            pending.extend(os.path.join(rel_dir, name) if rel_dir else name
+                           for name in sorted(subdirs, reverse=True))
+        return file_count
+    
+    def plan_shards(self, job, run, roots):
+        # 把相对路径空间划分为单元并按路径哈希分配给各分片：从顶层开始，单元过少时再展开一层目录。
+        # 返回 (展开过的中间目录, [(目录列表, 文件列表)])
+        dirs, files, expanded = [''], [], []
+        for _ in range(3):
+            if len(dirs) + len(files) >= self.shard_count * 4:
+                break
+            next_dirs = []
+            for rel_dir in dirs:
+                subdirs, names = self._list_merged(job, run, roots, rel_dir)
+                next_dirs.extend(os.path.join(rel_dir, name) if rel_dir else name for name in subdirs)
+                files.extend(os.path.join(rel_dir, name) if rel_dir else name for name in names)
+            expanded.extend(dirs)
+            dirs = next_dirs
+        
+        shards = [([], []) for _ in range(self.shard_count)]
+        for rel_dir in dirs:
+            shards[zlib.crc32(os.fsencode(rel_dir)) % self.shard_count][0].append(rel_dir)
+        for rel_path in files:
+            shards[zlib.crc32(os.fsencode(rel_path)) % self.shard_count][1].append(rel_path)
+        return expanded, [shard for shard in shards if shard[0] or shard[1]]
+    
+    def sync_sharded(self, job, run):
+        # 协调进程：划分分片后交给进程池，各工作进程独立扫描、计算和复制自己的分片，
+        # 这里合并文件数、指标、写入记录和错误；任一分片失败时整次同步失败
+        if job.sync_direction == "bidirectional":
+            roots = list(job.sync_paths)
+        else:
+            source_idx = 0 if job.sync_direction == "source_to_dest" else 1
+            roots = [job.sync_paths[source_idx]]
+        expanded, shards = self.plan_shards(job, run, roots)
+        if job.sync_direction != "bidirectional":
+            # 展开过的中间目录不会被任何分片遍历，先在目标中创建
+            destination = job.sync_paths[1 - source_idx]
+            for rel_dir in expanded:
+                os.makedirs(os.path.join(destination, rel_dir), exist_ok=True)
+        
+        with self._shard_lock:
+            if self.shard_pool is None or self._shard_pool_size != self.shard_count:
+                if self.shard_pool is not None:
+                    self.shard_pool.shutdown(wait=False)
+                self.shard_pool = ProcessPoolExecutor(max_workers=self.shard_count)
+                self._shard_pool_size = self.shard_count
+            pool = self.shard_pool
+        settings = {
+            'io_rate': self.io_budget.rate / self.shard_count,
+            'mtime_trust_window': self.mtime_trust_window,
+            'verify_mode': self.verify_mode,
+            'version_root': self.version_store.root if self.version_store is not None else None
+        }
+        # 工作进程不写事件日志，同步完成前崩溃时下次启动执行完整同步
+        if self.journal:
+            self.journal.mark_incomplete(job.name, "分片同步未完成")
+        self.log(f"[{job.name}] 分片同步: {len(shards)} 个分片")
+        
+        file_count = 0
+        errors = []
+        futures = [pool.submit(run_sync_shard, job.to_dict(), shard, settings) for shard in shards]
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            for message in result['logs']:
+                self.log(message)
+            file_count += result['file_count']
+            run.metrics.update(result['metrics'])
+            run.copied.extend(result['copied'])
+            job.requeued.extend(result['requeued'])
+            for path in result['written']:
+                self.echo_suppressor.record(path)
+            if result['versions'] and self.version_store is not None:
+                self.version_store.merge(*result['versions'])
+            if result['error']:
+                errors.append(result['error'])
+        run.metrics['shards_run'] += len(shards)
+        
+        if errors:
+            raise RuntimeError(f"{len(errors)} 个分片失败: {errors[0]}")
+        return file_count
+    
+    def sync_targets(self, job, paths):
+        # 定向同步：只处理给定的路径(事件日志重放、单文件事件)，不扫描整个目录树
+        self.log(f"[{job.name}] 定向同步 {len(paths)} 个路径...")
+        file_count = 0
+        success = True
+        run = SyncRun(job)
+        journal_mark = self.journal.mark() if self.journal else None
+        
+        try:
+            file_count += self.replay_unfinished_ops(run)
+            rel_paths = {self._rel_path(job.sync_paths, path) for path in paths}
+            for rel_path in sorted(rel_path for rel_path in rel_paths if rel_path):
+                file_count += self.sync_entry(job, rel_path, run)
+            
+            self.verify_copies(run)
+            
+            if self.journal:
+                self.journal.record_synced(job.name, journal_mark, paths)
+            job.last_sync_time = datetime.now()
+            status = f"定向同步 {file_count} 个文件"
+            self.log(f"[{job.name}] 同步完成: {status}")
+        except Exception as e:
+            status = f"同步失败: {str(e)}"
+            self.log(f"[{job.name}] {status}")
+            success = False
+        
+        self.commit_versions(run)
+        return file_count, status, success, run
+    
+    def filter_entries(self, entries, file_filters):
+        return (entry for entry in entries
+                if self.file_passes_filters(entry[0], file_filters, entry[1]))
+    
+    def plan_from_entries(self, source_entries, dest_entries, sync_direction, file_filters):
+        # 由清单或实时目录的条目流计算同步计划，不需要同时扫描两侧目录
+        return plan_manifest_sync(self.filter_entries(source_entries, file_filters),
+                                  self.filter_entries(dest_entries, file_filters),
+                                  sync_direction)
+    
+    def apply_plan(self, job, plan, source_root, dest_root):
+        # 按计划复制文件，返回 (文件数, 本次运行上下文)。清单可能已经过时(例如源文件已删除)，
+        # 单个文件复制失败只记录日志并计数，其余文件继续复制
+        run = SyncRun(job)
+        file_count = 0
+        for rel_path, direction in plan:
+            local_path = rel_path.replace('/', os.sep)
+            src_path = os.path.join(source_root, local_path)
+            dest_path = os.path.join(dest_root, local_path)
+            if direction == 'to_source':
+                src_path, dest_path = dest_path, src_path
+            try:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                self.copy_file(src_path, dest_path, run)
+            except OSError as e:
+                run.metrics['plan_copy_failures'] += 1
+                self.log(f"复制失败: 从 {src_path} 到 {dest_path}: {str(e)}")
+                continue
+            file_count += 1
+            self.log(f"同步文件: 从 {src_path} 到 {dest_path}")
+        self.verify_copies(run)
+        self.commit_versions(run)
+        return file_count, run
+    
+    def shutdown(self):
+        with self._verify_lock:
+            if self.verify_pool is not None:
+                self.verify_pool.shutdown(wait=False)
+                self.verify_pool = None
+        if self.shard_pool is not None:
+            self.shard_pool.shutdown(wait=False)
+            self.shard_pool = None
+    
+    def sync_job(self, job):
+        # 执行一次完整同步，返回 (文件数, 状态, 是否成功, 本次运行上下文)
+        self.log(f"[{job.name}] 开始同步文件...")
+        file_count = 0
+        success = True
+        run = SyncRun(job)
+        sync_paths = list(job.sync_paths)
+        file_filters = job.file_filters
+        journal_mark = self.journal.mark() if self.journal else None
+        
+        try:
+            # 重做事件日志中未完成的复制操作
+            file_count += self.replay_unfinished_ops(run)
+            
+            # 重新复制上次校验不一致的文件
+            requeued, job.requeued = job.requeued, []
+            for src_path, dest_path in requeued:
+                if os.path.exists(src_path):
+                    self.copy_file(src_path, dest_path, run)
+                    run.metrics['verify_requeued'] += 1
+                    file_count += 1
+                    self.log(f"重新复制: 从 {src_path} 到 {dest_path}")
+            
+            # 先执行冲突队列中已决定的处理
+            file_count += self.apply_conflict_resolutions(run)
+            
+            # 单向同步逻辑
+            if job.sync_direction in ["source_to_dest", "dest_to_source"]:
+                source_idx = 0 if job.sync_direction == "source_to_dest" else 1
+                dest_idx = 1 if job.sync_direction == "source_to_dest" else 0
+                
+                source = sync_paths[source_idx]
+                destination = sync_paths[dest_idx]
+                
+                if os.path.isfile(source) and os.path.isfile(destination):
+                    # 文件同步
+                    if self.file_passes_filters(source, file_filters):
+                        self.copy_file(source, destination, run)
+                        file_count += 1
+                        self.log(f"同步文件: 从 {source} 到 {destination}")
+                elif os.path.isdir(source) and os.path.isdir(destination):
+                    # 文件夹同步
+                    if self.sharding and self.shard_count > 1:
+                        file_count += self.sync_sharded(job, run)
+                    else:
+                        file_count += self.sync_one_way(job, run)
+            else:
+                # 双向同步逻辑
+                if (self.sharding and self.shard_count > 1
+                        and all(os.path.isdir(path) for path in sync_paths)):
+                    file_count += self.sync_sharded(job, run)
+                else:
+                    file_count += self.sync_bidirectional(job, run)
+            
+            self.verify_copies(run)
+            
+            if self.journal:
+                self.journal.record_synced(job.name, journal_mark)
+            job.last_sync_time = datetime.now()
+            status = f"成功同步 {file_count} 个文件"
+            if run.verify_mismatches:
+                status += f"，{len(run.verify_mismatches)} 个校验不一致"
+            self.log(f"[{job.name}] 同步完成: {status}")
+        except Exception as e:
+            status = f"同步失败: {str(e)}"
+            self.log(f"[{job.name}] {status}")
+            success = False
+        
+        self.commit_versions(run)
+        return file_count, status, success, run
+
+# 工作进程中按任务保留的目录扫描缓存，进程池复用进程时后续运行仍可复用目录列表
+_shard_scan_caches = {}
+
+def run_sync_shard(job_data, shard, settings):
+    # 在工作进程中同步一个分片，结果交给协调进程合并
+    job = SyncJob.from_dict(job_data)
+    job.scan_cache = _shard_scan_caches.setdefault(job.name, DirectoryScanCache())
+    logs = []
+    engine = SyncEngine(logs.append, None, IOBudget(settings['io_rate']))
+    engine.mtime_trust_window = settings['mtime_trust_window']
+    engine.verify_mode = settings['verify_mode']
+    if settings['version_root']:
+        engine.version_store = VersionStore(settings['version_root'])
+        engine.version_store.added = []
+    run = SyncRun(job)
+    
+    file_count = 0
+    error = None
+    try:
+        if job.sync_direction == "bidirectional":
+            file_count = engine.sync_bidirectional(job, run, shard)
+        else:
+            file_count = engine.sync_one_way(job, run, shard)
+    except Exception as e:
+        error = str(e)
+    
+    versions = None
+    if engine.version_store is not None:
+        added = engine.version_store.added
+        chunks = {digest: engine.version_store.chunks[digest]
+                  for _, version in added for digest in version['chunks']}
+        versions = (added, chunks)
+    return {
+        'file_count': file_count,
+        'metrics': dict(run.metrics),
+        'copied': run.copied,
+        'requeued': job.requeued,
+        'written': engine.echo_suppressor.paths(),
+        'logs': logs,
+        'versions': versions,
+        'error': error
+    }
+
+class StackSampler:
+    # 采样剖析：后台线程定时读取目标线程的调用栈，按折叠栈格式累计，可直接用于生成火焰图
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+class RunProfiler:
+    # 对接下来的若干次同步运行做性能剖析：确定性剖析(cProfile，输出 .pstats)或采样剖析(输出折叠栈 .folded)。
+    # 未启用时同步路径上只有一次计数检查
+    MODES = ("cprofile", "sampling")
+    
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.remaining = 0
+        self.mode = "cprofile"
+        self._active = False  # cProfile 同一时刻只能剖析一个运行
+        self._lock = threading.Lock()
+    
+    def arm(self, count, mode="cprofile"):
+        with self._lock:
+            self.remaining = count
+            self.mode = mode
+    
+    def start(self, job):
+        # 在执行同步的线程中调用；本次运行不剖析时返回 None
+        with self._lock:
+            if self.remaining <= 0 or (self.mode == "cprofile" and self._active):
+                return None
+            self.remaining -= 1
+            mode = self.mode
+            if mode == "cprofile":
+                self._active = True
+        
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 已有其他剖析工具在运行
+                with self._lock:
+                    self._active = False
+                    self.remaining += 1
+                return None
+        else:
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        return mode, profiler, job.name
+    
+    def finish(self, session):
+        # 停止剖析并写出文件，返回文件路径
+        mode, profiler, job_name = session
+        if mode == "cprofile":
+            profiler.disable()
+            with self._lock:
+                self._active = False
+        else:
+            stacks = profiler.stop()
+        
+        os.makedirs(self.out_dir, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in job_name)
+        base = os.path.join(self.out_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{safe_name}-{uuid.uuid4().hex[:6]}")
+        if mode == "cprofile":
+            path = base + '.pstats'
+            profiler.dump_stats(path)
+        else:
+            path = base + '.folded'
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        return path
 
 class SyncHandler(FileSystemEventHandler):
-    def __init__(self, sync_tool):
+    def __init__(self, sync_tool, job):
         super().__init__()
         self.sync_tool = sync_tool
+        self.job = job
+    
+    def dispatch(self, event):
+        # 处理器抛出的异常会终止 Observer 线程，之后所有任务的事件都会丢失
+        try:
+            super().dispatch(event)
+        except Exception as e:
+            self.sync_tool.journal.mark_incomplete(self.job.name, f"处理监控事件出错: {str(e)}")
+            self.sync_tool.log(f"[{self.job.name}] 处理监控事件出错: {str(e)}")
+    
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.handle_change(event.src_path)
+    
+    def handle_change(self, path):
+        # 同步自身写入产生的事件不再触发新的同步
+        engine = self.sync_tool.engine
+        if engine.echo_suppressor.is_echo(path):
+            dropped = ['echo_events_dropped']
+            # 任务已有排队中的请求时该事件本会被合并，不算避免了一次同步
+            if not self.sync_tool.scheduler.is_queued(self.job):
+                dropped.append('sync_passes_avoided')
+            for key in dropped:
+                engine.metrics[key] += 1
+                self.job.event_metrics[key] += 1
+            return
+        # 先写入事件日志，崩溃后可据此重放
+        self.sync_tool.journal.record_event(self.job.name, path)
+        self.sync_tool.log(f"[{self.job.name}] 检测到文件修改: {path}")
+        self.request_sync(path)
+    
+    def request_sync(self, path):
+        self.sync_tool.sync_files(self.job)
+
+class FileRootHandler(SyncHandler):
+    # 文件根无法直接监控，改为非递归监控其父目录，只处理文件根本身的事件，并只定向同步该文件
+    def __init__(self, sync_tool, job, roots):
+        super().__init__(sync_tool, job)
+        self.roots = {os.path.abspath(root): root for root in roots}
+    
+    def _root_for(self, event, path):
+        if event.is_directory:
+            return None
+        return self.roots.get(os.path.abspath(path))
+    
+    def on_modified(self, event):
+        root = self._root_for(event, event.src_path)
+        if root:
+            self.handle_change(root)
+    
+    on_created = on_modified
+    
+    def on_moved(self, event):
+        # 编辑器常以"写入临时文件后重命名"的方式保存
+        root = self._root_for(event, event.dest_path)
+        if root:
+            self.handle_change(root)
+    
+    def request_sync(self, path):
+        self.sync_tool.sync_files(self.job, {path})
+
+def inotify_watch_count():
+    # 本进程当前注册的 inotify 监控数，通过 /proc/self/fdinfo 统计；非 Linux 返回 None
+    try:
+        names = os.listdir('/proc/self/fdinfo')
+    except OSError:
+        return None
+    count = 0
+    for name in names:
+        try:
+            with open(os.path.join('/proc/self/fdinfo', name), 'r') as f:
+                count += sum(1 for line in f if line.startswith('inotify wd:'))
+        except OSError:
+            continue
+    return count
+
+class HybridHandler(SyncHandler):
+    # 热目录的非递归监控事件：文件变化定向同步，新建的子目录交给轮询
+    def __init__(self, sync_tool, job, watcher):
+        super().__init__(sync_tool, job)
+        self.watcher = watcher
+    
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.touch(os.path.dirname(event.src_path))
+            self.handle_change(event.src_path)
+    
+    def on_created(self, event):
+        if event.is_directory:
+            self.watcher.add_dir(event.src_path, new=True)
+        else:
+            self.on_modified(event)
+    
+    def on_moved(self, event):
+        if event.is_directory:
+            self.watcher.add_dir(event.dest_path, new=True)
+        else:
+            self.watcher.touch(os.path.dirname(event.dest_path))
+            self.handle_change(event.dest_path)
+    
+    def request_sync(self, path):
+        self.sync_tool.sync_files(self.job, {path})
+
+class HybridWatcher:
+    # 混合监控：只对近期有变化的"热"目录注册非递归监控，其余"冷"目录由后台线程分批增量轮询。
+    # 轮询发现变化的目录升级为热目录，长时间没有变化的热目录降级回轮询，监控数量不随目录树增长
+    def __init__(self, sync_tool, job, max_hot=256, demote_after=600, poll_interval=2.0, poll_batch=200):
+        self.sync_tool = sync_tool
+        self.job = job
+        self.max_hot = max_hot
+        self.demote_after = demote_after  # 秒
+        self.poll_interval = poll_interval  # 秒
+        self.poll_batch = poll_batch  # 每轮轮询的目录数
+        self.registration_time = 0.0
+        self.stats = Counter()
+        # 使用独立的 Observer，降级时可以注销监控而不影响其他任务对同一目录的监控
+        self.observer = Observer()
+        self.handler = HybridHandler(sync_tool, job, self)
+        self._hot = {}  # 目录 -> (监控, 最近活动时间)
+        # 目录 -> (目录修改时间, 最新文件修改时间)；None 表示尚未扫描，{} 表示新建目录(首次扫描即上报全部文件)
+        self._snapshots = {}
+        self._subdirs = {}  # 目录 -> 上次扫描时的子目录名集合
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
     
-    def on_modified(self, event):
-        if not event.is_directory:
-            self.sync_tool.log(f"检测到文件修改: {event.src_path}")
-            self.sync_tool.sync_files()
+    def start(self):
+        start = time.perf_counter()
+        self.observer.start()
+        for root in self.job.sync_paths:
+            if os.path.isdir(root):
+                self.add_dir(root)
+                # 先扫描一次根目录，使其子目录进入轮询，再升级为热目录
+                listing = self._scan(root)
+                if listing:
+                    self._record(root, listing)
+                self.promote(root)
+        self.registration_time = time.perf_counter() - start
+        self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.observer.stop()
+        self.observer.join()
+    
+    def hot_count(self):
+        with self._lock:
+            return len(self._hot)
+    
+    def describe(self):
+        with self._lock:
+            info = (f"混合: {len(self._hot)} 个热目录监控, {len(self._snapshots)} 个目录轮询, "
+                    f"已轮询 {self.stats['dirs_polled']} 次, "
+                    f"升级 {self.stats['promoted']} 次, 降级 {self.stats['demoted']} 次, "
+                    f"初始注册 {self.registration_time * 1000:.0f}毫秒")
+        if self.stats['watch_failures']:
+            info += f", 监控失败 {self.stats['watch_failures']} 次"
+        return info
+    
+    def add_dir(self, path, new=False):
+        with self._lock:
+            if path not in self._snapshots:
+                self._snapshots[path] = {} if new else None
+                self._queue.append(path)
+    
+    def touch(self, path):
+        with self._lock:
+            if path in self._hot:
+                self._hot[path] = (self._hot[path][0], time.monotonic())
+    
+    def promote(self, path):
+        with self._lock:
+            if path in self._hot:
+                self._hot[path] = (self._hot[path][0], time.monotonic())
+                return
+            coldest = None
+            if len(self._hot) >= self.max_hot:
+                coldest = min(self._hot, key=lambda hot_path: self._hot[hot_path][1])
+        if coldest:
+            self.demote(coldest)
+        try:
+            watch = self.observer.schedule(self.handler, path, recursive=False)
+        except OSError as e:
+            # 监控注册失败时该目录继续由轮询覆盖
+            self.stats['watch_failures'] += 1
+            self.sync_tool.log(f"[{self.job.name}] 无法监控 {path}: {str(e)}")
+            return
+        with self._lock:
+            self._hot[path] = (watch, time.monotonic())
+        self.stats['promoted'] += 1
+    
+    def demote(self, path):
+        with self._lock:
+            entry = self._hot.pop(path, None)
+        if entry is None:
+            return
+        self.observer.unschedule(entry[0])
+        # 以当前状态为基准，降级期间的变化由之后的轮询发现
+        listing = self._scan(path)
+        if listing:
+            self._record(path, listing)
+        else:
+            with self._lock:
+                self._snapshots[path] = None
+        self.stats['demoted'] += 1
+    
+    def _scan(self, path):
+        # 返回 (子目录列表, (目录修改时间, 最新文件修改时间), [(文件名, 修改时间)])；目录不可读时返回 None
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+            subdirs, files = [], []
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif not entry.is_dir():
+                        try:
+                            files.append((entry.name, entry.stat().st_mtime_ns))
+                        except OSError:
+                            continue
+        except OSError:
+            return None
+        newest = max((mtime for _, mtime in files), default=0)
+        return subdirs, (dir_mtime, newest), files
+    
+    def _record(self, path, listing):
+        # 保存目录的扫描结果并把子目录加入轮询，返回该目录上一次的快照
+        subdirs, snapshot, _ = listing
+        with self._lock:
+            previous = self._snapshots.get(path)
+            known = self._subdirs.get(path)
+            self._snapshots[path] = snapshot
+            self._subdirs[path] = set(subdirs)
+        for name in subdirs:
+            # 只有新建目录中的子目录和父目录上次列表中没有的子目录是新建的，其中的文件都需要同步
+            new = previous == {} or (known is not None and name not in known)
+            self.add_dir(os.path.join(path, name), new=new)
+        return previous
+    
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.sync_tool.log(f"[{self.job.name}] 轮询出错: {str(e)}")
+    
+    def poll_once(self):
+        # 每轮只检查一批目录，整棵树在若干轮内轮询一遍；返回发现变化的文件
+        now = time.monotonic()
+        with self._lock:
+            idle = [path for path, (_, last) in self._hot.items() if now - last > self.demote_after]
+        for path in idle:
+            self.demote(path)
+        
+        changed = []
+        for _ in range(min(self.poll_batch, len(self._queue))):
+            with self._lock:
+                path = self._queue.popleft()
+                hot = path in self._hot
+            
+            listing = self._scan(path)
+            self.stats['dirs_polled'] += 1
+            if listing is None:
+                with self._lock:
+                    self._snapshots.pop(path, None)
+                    self._subdirs.pop(path, None)
+                continue
+            previous = self._record(path, listing)
+            with self._lock:
+                self._queue.append(path)
+            if hot:
+                # 热目录的文件变化由监控事件覆盖，这里只发现新的子目录
+                continue
+            
+            _, snapshot, files = listing
+            if previous == {}:
+                dir_changed = [os.path.join(path, name) for name, _ in files]
+            elif previous is None or previous == snapshot:
+                dir_changed = []
+            elif previous[0] != snapshot[0]:
+                # 目录条目有增删或重命名(重命名保留原修改时间)，目录中的文件都作为候选
+                dir_changed = [os.path.join(path, name) for name, _ in files]
+            else:
+                dir_changed = [os.path.join(path, name) for name, mtime in files if mtime > previous[1]]
+            if dir_changed:
+                changed.extend(dir_changed)
+                self.promote(path)
+        
+        changed = [path for path in changed if not self.sync_tool.engine.echo_suppressor.is_echo(path)]
+        if changed:
+            for path in changed:
+                self.sync_tool.journal.record_event(self.job.name, path)
+            self.sync_tool.log(f"[{self.job.name}] 轮询发现 {len(changed)} 个文件变化")
+            self.sync_tool.sync_files(self.job, set(changed))
+        return changed
 
 class FileSyncTool(QMainWindow):
-    def __init__(self):
+    # 工作线程通过信号更新界面
+    log_message = pyqtSignal(str)
+    sync_finished = pyqtSignal(object)
+    job_status_changed = pyqtSignal()
+    
+    def __init__(self, data_dir=APP_DATA_DIR):
         super().__init__()
         self.setWindowTitle("高级文件同步工具")
         self.setGeometry(100, 100, 1000, 800)
         
         # 初始化变量
-        self.sync_paths = []
+        self.data_dir = data_dir
+        self.jobs_file = os.path.join(data_dir, 'jobs.json')
+        self.jobs = self.load_jobs()
+        self.current_job = self.jobs[0]
         self.observer = None
-        self.sync_handler = SyncHandler(self)
-        self.last_sync_time = None
         self.sync_history = []
-        self.conflict_resolution = "newer"  # newer, larger, ask
-        self.sync_direction = "bidirectional"  # bidirectional, source_to_dest, dest_to_source
-        self.file_filters = {
-            'extensions': [],
-            'min_size': 0,
-            'max_size': 0,
-            'exclude_hidden': True
-        }
+        self.io_budget = IOBudget()
+        self.conflict_queue = ConflictQueue(os.path.join(data_dir, 'conflicts.json'))
+        self.journal = EventJournal(os.path.join(data_dir, 'journal.log'))
+        self.version_store = VersionStore(os.path.join(data_dir, 'versions'))
+        self.profiler = RunProfiler(os.path.join(data_dir, 'profiles'))
+        self.engine = SyncEngine(self.log, self.conflict_queue, self.io_budget, self.journal)
+        self.scheduler = JobScheduler(self.run_job)
+        
+        self.log_message.connect(self.append_log)
+        self.sync_finished.connect(self.on_sync_finished)
+        self.job_status_changed.connect(self.update_job_table)
         
         # 创建UI
         self.init_ui()
+        self.load_job_settings()
         
-        # 设置定时器
-        self.sync_timer = QTimer(self)
-        self.sync_timer.timeout.connect(self.sync_files)
-        
+        # 重放上次退出或崩溃前未处理的事件
+        self.replay_journal()
+    
     def init_ui(self):
         main_widget = QWidget()
         main_layout = QVBoxLayout()
@@ -63,6 +2383,9 @@ class FileSyncTool(QMainWindow):
         # 高级设置选项卡
         self.setup_advanced_tab()
         
+        # 冲突队列选项卡
+        self.setup_conflict_tab()
+        
         # 历史记录选项卡
         self.setup_history_tab()
         
@@ -72,17 +2395,52 @@ class FileSyncTool(QMainWindow):
         
         # 初始状态
         self.update_buttons_state()
-        
+        self.update_conflict_table()
+        self.update_job_table()
+    
     def setup_basic_tab(self):
         basic_tab = QWidget()
         layout = QVBoxLayout()
         
+        # 同步任务部分
+        job_group = QGroupBox("同步任务")
+        job_layout = QVBoxLayout()
+        
+        job_select_layout = QHBoxLayout()
+        job_select_layout.addWidget(QLabel("当前任务:"))
+        self.job_combo = QComboBox()
+        for job in self.jobs:
+            self.job_combo.addItem(job.name)
+        self.job_combo.currentIndexChanged.connect(self.switch_job)
+        job_select_layout.addWidget(self.job_combo)
+        
+        self.add_job_btn = QPushButton("新建任务")
+        self.add_job_btn.clicked.connect(self.add_job)
+        job_select_layout.addWidget(self.add_job_btn)
+        
+        self.remove_job_btn = QPushButton("删除任务")
+        self.remove_job_btn.clicked.connect(self.remove_job)
+        job_select_layout.addWidget(self.remove_job_btn)
+        job_layout.addLayout(job_select_layout)
+        
+        self.job_table = QTableWidget()
+        self.job_table.setColumnCount(6)
+        self.job_table.setHorizontalHeaderLabels(["任务", "路径数", "状态", "上次同步", "结果", "监控"])
+        self.job_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.job_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.job_table.setMaximumHeight(150)
+        job_layout.addWidget(self.job_table)
+        
+        job_group.setLayout(job_layout)
+        layout.addWidget(job_group)
+        
         # 路径管理部分
         path_group = QGroupBox("路径管理")
         path_layout = QHBoxLayout()
         
         self.path_list = QListWidget()
         self.path_list.setSelectionMode(QListWidget.SingleSelection)
+        self.path_list.currentRowChanged.connect(self.update_buttons_state)
         path_layout.addWidget(self.path_list)
         
         btn_layout = QVBoxLayout()
@@ -106,18 +2464,19 @@ class FileSyncTool(QMainWindow):
         self.interval_spin = QSpinBox()
         self.interval_spin.setRange(5, 3600)
         self.interval_spin.setValue(60)
+        self.interval_spin.valueChanged.connect(self.update_interval)
         control_layout.addWidget(self.interval_spin)
         
         self.start_btn = QPushButton("开始监控")
-        self.start_btn.clicked.connect(self.start_monitoring)
+        self.start_btn.clicked.connect(lambda: self.start_monitoring())
         control_layout.addWidget(self.start_btn)
         
         self.stop_btn = QPushButton("停止监控")
-        self.stop_btn.clicked.connect(self.stop_monitoring)
+        self.stop_btn.clicked.connect(lambda: self.stop_monitoring())
         control_layout.addWidget(self.stop_btn)
         
         self.sync_now_btn = QPushButton("立即同步")
-        self.sync_now_btn.clicked.connect(self.sync_files)
+        self.sync_now_btn.clicked.connect(lambda: self.sync_files())
         control_layout.addWidget(self.sync_now_btn)
         
         control_group.setLayout(control_layout)
@@ -153,6 +2512,19 @@ class FileSyncTool(QMainWindow):
         direction_group.setLayout(direction_layout)
         layout.addWidget(direction_group)
         
+        # 监控方式设置
+        watch_group = QGroupBox("监控方式")
+        watch_layout = QVBoxLayout()
+        
+        self.watch_mode_combo = QComboBox()
+        self.watch_mode_combo.addItem("递归监控 (每个子目录一个监控)", "recursive")
+        self.watch_mode_combo.addItem("混合监控 (活跃目录监控 + 其余目录轮询, 适合超大目录树)", "hybrid")
+        self.watch_mode_combo.currentIndexChanged.connect(self.update_watch_mode)
+        watch_layout.addWidget(self.watch_mode_combo)
+        
+        watch_group.setLayout(watch_layout)
+        layout.addWidget(watch_group)
+        
         # 冲突解决设置
         conflict_group = QGroupBox("冲突解决")
         conflict_layout = QVBoxLayout()
@@ -160,7 +2532,7 @@ class FileSyncTool(QMainWindow):
         self.conflict_combo = QComboBox()
         self.conflict_combo.addItem("保留较新的文件", "newer")
         self.conflict_combo.addItem("保留较大的文件", "larger")
-        self.conflict_combo.addItem("每次询问", "ask")
+        self.conflict_combo.addItem("加入冲突队列(批量处理)", "ask")
         self.conflict_combo.currentIndexChanged.connect(self.update_conflict_resolution)
         conflict_layout.addWidget(self.conflict_combo)
         
@@ -204,21 +2576,183 @@ class FileSyncTool(QMainWindow):
         filter_group.setLayout(filter_layout)
         layout.addWidget(filter_group)
         
+        # 资源调度设置(所有任务共享)
+        resource_group = QGroupBox("资源调度(所有任务共享)")
+        resource_layout = QHBoxLayout()
+        
+        resource_layout.addWidget(QLabel("并发任务数:"))
+        self.worker_spin = QSpinBox()
+        self.worker_spin.setRange(1, 16)
+        self.worker_spin.setValue(self.scheduler.max_workers)
+        self.worker_spin.valueChanged.connect(self.update_worker_count)
+        resource_layout.addWidget(self.worker_spin)
+        
+        resource_layout.addWidget(QLabel("全局I/O预算(MB/s, 0为不限):"))
+        self.io_budget_spin = QSpinBox()
+        self.io_budget_spin.setRange(0, 10000)
+        self.io_budget_spin.setValue(0)
+        self.io_budget_spin.valueChanged.connect(self.update_io_budget)
+        resource_layout.addWidget(self.io_budget_spin)
+        
+        resource_layout.addWidget(QLabel("目录mtime信任窗口(秒):"))
+        self.trust_window_spin = QSpinBox()
+        self.trust_window_spin.setRange(0, 3600)
+        self.trust_window_spin.setValue(self.engine.mtime_trust_window)
+        self.trust_window_spin.valueChanged.connect(self.update_trust_window)
+        resource_layout.addWidget(self.trust_window_spin)
+        
+        self.sharding_check = QCheckBox("多进程分片同步")
+        self.sharding_check.stateChanged.connect(self.update_shard_settings)
+        resource_layout.addWidget(self.sharding_check)
+        
+        resource_layout.addWidget(QLabel("分片数:"))
+        self.shard_spin = QSpinBox()
+        self.shard_spin.setRange(2, 256)
+        self.shard_spin.setValue(max(self.engine.shard_count, 2))
+        self.shard_spin.valueChanged.connect(self.update_shard_settings)
+        resource_layout.addWidget(self.shard_spin)
+        
+        resource_group.setLayout(resource_layout)
+        layout.addWidget(resource_group)
+        
+        # 复制校验设置
+        verify_group = QGroupBox("复制校验")
+        verify_layout = QHBoxLayout()
+        
+        self.verify_combo = QComboBox()
+        self.verify_combo.addItem("关闭", "off")
+        self.verify_combo.addItem("校验全部文件", "all")
+        self.verify_combo.addItem("抽样校验", "sample")
+        self.verify_combo.currentIndexChanged.connect(self.update_verify_settings)
+        verify_layout.addWidget(self.verify_combo)
+        
+        verify_layout.addWidget(QLabel("抽样比例(%):"))
+        self.verify_percent_spin = QSpinBox()
+        self.verify_percent_spin.setRange(1, 100)
+        self.verify_percent_spin.setValue(self.engine.verify_percent)
+        self.verify_percent_spin.valueChanged.connect(self.update_verify_settings)
+        verify_layout.addWidget(self.verify_percent_spin)
+        
+        verify_layout.addWidget(QLabel("总是校验大于(MB, 0为不限):"))
+        self.verify_size_spin = QSpinBox()
+        self.verify_size_spin.setRange(0, 1024 * 1024)
+        self.verify_size_spin.setValue(0)
+        self.verify_size_spin.valueChanged.connect(self.update_verify_settings)
+        verify_layout.addWidget(self.verify_size_spin)
+        
+        verify_group.setLayout(verify_layout)
+        layout.addWidget(verify_group)
+        
+        # 版本备份设置
+        version_group = QGroupBox("版本备份")
+        version_layout = QHBoxLayout()
+        
+        self.versioning_check = QCheckBox("覆盖前保存旧版本")
+        self.versioning_check.stateChanged.connect(self.update_version_settings)
+        version_layout.addWidget(self.versioning_check)
+        
+        version_layout.addWidget(QLabel("每个文件保留版本数(0为不限):"))
+        self.keep_versions_spin = QSpinBox()
+        self.keep_versions_spin.setRange(0, 1000)
+        self.keep_versions_spin.setValue(self.version_store.keep_versions)
+        self.keep_versions_spin.valueChanged.connect(self.update_version_settings)
+        version_layout.addWidget(self.keep_versions_spin)
+        
+        version_layout.addWidget(QLabel("保留天数(0为不限):"))
+        self.keep_days_spin = QSpinBox()
+        self.keep_days_spin.setRange(0, 3650)
+        self.keep_days_spin.setValue(self.version_store.keep_days)
+        self.keep_days_spin.valueChanged.connect(self.update_version_settings)
+        version_layout.addWidget(self.keep_days_spin)
+        
+        self.clean_versions_btn = QPushButton("立即清理")
+        self.clean_versions_btn.clicked.connect(self.clean_versions)
+        version_layout.addWidget(self.clean_versions_btn)
+        
+        version_group.setLayout(version_layout)
+        layout.addWidget(version_group)
+        
         advanced_tab.setLayout(layout)
         self.tabs.addTab(advanced_tab, "高级设置")
     
+    def setup_conflict_tab(self):
+        conflict_tab = QWidget()
+        layout = QVBoxLayout()
+        
+        # 冲突列表
+        self.conflict_table = QTableWidget()
+        self.conflict_table.setColumnCount(5)
+        self.conflict_table.setHorizontalHeaderLabels(["任务", "源文件", "目标文件", "发现时间", "处理方式"])
+        self.conflict_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.conflict_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.conflict_table.setSelectionMode(QTableWidget.ExtendedSelection)
+        layout.addWidget(self.conflict_table)
+        
+        # 批量处理规则
+        rule_layout = QHBoxLayout()
+        rule_layout.addWidget(QLabel("路径模式:"))
+        self.conflict_pattern_edit = QLineEdit()
+        self.conflict_pattern_edit.setPlaceholderText("如 *.docx, 留空匹配全部")
+        rule_layout.addWidget(self.conflict_pattern_edit)
+        
+        self.conflict_rule_combo = QComboBox()
+        for label, rule in CONFLICT_RULES:
+            self.conflict_rule_combo.addItem(label, rule)
+        rule_layout.addWidget(self.conflict_rule_combo)
+        
+        self.resolve_selected_btn = QPushButton("应用到选中项")
+        self.resolve_selected_btn.clicked.connect(self.resolve_selected_conflicts)
+        rule_layout.addWidget(self.resolve_selected_btn)
+        
+        self.resolve_matching_btn = QPushButton("应用到匹配项")
+        self.resolve_matching_btn.clicked.connect(self.resolve_matching_conflicts)
+        rule_layout.addWidget(self.resolve_matching_btn)
+        
+        layout.addLayout(rule_layout)
+        layout.addWidget(QLabel("处理方式将在下一次同步时批量执行"))
+        
+        conflict_tab.setLayout(layout)
+        self.conflict_tab = conflict_tab
+        self.tabs.addTab(conflict_tab, "冲突队列")
+    
     def setup_history_tab(self):
         history_tab = QWidget()
         layout = QVBoxLayout()
         
         # 历史记录表格
         self.history_table = QTableWidget()
-        self.history_table.setColumnCount(4)
-        self.history_table.setHorizontalHeaderLabels(["时间", "操作", "文件数", "状态"])
+        self.history_table.setColumnCount(7)
+        self.history_table.setHorizontalHeaderLabels(["时间", "任务", "操作", "文件数", "状态", "指标", "剖析文件"])
         self.history_table.setEditTriggers(QTableWidget.NoEditTriggers)
         self.history_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.history_table.cellDoubleClicked.connect(self.open_profile)
         layout.addWidget(self.history_table)
         
+        # 性能剖析
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(QLabel("剖析接下来的同步次数:"))
+        self.profile_runs_spin = QSpinBox()
+        self.profile_runs_spin.setRange(1, 100)
+        self.profile_runs_spin.setValue(1)
+        profile_layout.addWidget(self.profile_runs_spin)
+        
+        self.profile_mode_combo = QComboBox()
+        self.profile_mode_combo.addItem("确定性剖析 (cProfile, .pstats)", "cprofile")
+        self.profile_mode_combo.addItem("采样剖析 (折叠栈, 可生成火焰图)", "sampling")
+        profile_layout.addWidget(self.profile_mode_combo)
+        
+        self.profile_btn = QPushButton("开始剖析")
+        self.profile_btn.clicked.connect(self.arm_profiler)
+        profile_layout.addWidget(self.profile_btn)
+        
+        self.profile_label = QLabel()
+        profile_layout.addWidget(self.profile_label)
+        layout.addLayout(profile_layout)
+        
+        self.version_label = QLabel()
+        layout.addWidget(self.version_label)
+        self.update_version_label()
+        
         # 历史记录操作按钮
         btn_layout = QHBoxLayout()
         self.clear_history_btn = QPushButton("清除历史")
@@ -234,62 +2768,207 @@ class FileSyncTool(QMainWindow):
         history_tab.setLayout(layout)
         self.tabs.addTab(history_tab, "同步历史")
     
+    def load_jobs(self):
+        try:
+            with open(self.jobs_file, 'r', encoding='utf-8') as f:
+                jobs = [SyncJob.from_dict(data) for data in json.load(f)]
+        except (OSError, ValueError, KeyError):
+            jobs = []
+        return jobs or [SyncJob("默认任务")]
+    
+    def save_jobs(self):
+        try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            with open(self.jobs_file, 'w', encoding='utf-8') as f:
+                json.dump([job.to_dict() for job in self.jobs], f, ensure_ascii=False, indent=1)
+        except OSError as e:
+            self.log(f"无法保存任务配置: {str(e)}")
+    
+    def load_job_settings(self):
+        # 把当前任务的设置同步到界面控件
+        job = self.current_job
+        
+        self.path_list.clear()
+        self.path_list.addItems(job.sync_paths)
+        
+        widgets = (self.interval_spin, self.direction_combo, self.conflict_combo, self.watch_mode_combo)
+        for widget in widgets:
+            widget.blockSignals(True)
+        self.interval_spin.setValue(job.interval)
+        self.direction_combo.setCurrentIndex(self.direction_combo.findData(job.sync_direction))
+        self.conflict_combo.setCurrentIndex(self.conflict_combo.findData(job.conflict_resolution))
+        self.watch_mode_combo.setCurrentIndex(self.watch_mode_combo.findData(job.watch_mode))
+        for widget in widgets:
+            widget.blockSignals(False)
+        
+        filters = job.file_filters
+        self.ext_edit.setText(','.join(filters['extensions']))
+        self.min_size_edit.setText(str(filters['min_size'] // 1024) if filters['min_size'] else "")
+        self.max_size_edit.setText(str(filters['max_size'] // 1024) if filters['max_size'] else "")
+        self.exclude_hidden_check.setChecked(filters['exclude_hidden'])
+        
+        self.update_buttons_state()
+    
+    def switch_job(self, index):
+        if 0 <= index < len(self.jobs):
+            self.current_job = self.jobs[index]
+            self.load_job_settings()
+            self.log(f"切换到任务: {self.current_job.name}")
+    
+    def add_job(self):
+        name, ok = QInputDialog.getText(self, "新建任务", "任务名称:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        if any(job.name == name for job in self.jobs):
+            QMessageBox.information(self, "提示", "该任务已存在!")
+            return
+        
+        self.jobs.append(SyncJob(name))
+        self.save_jobs()
+        self.job_combo.addItem(name)
+        self.job_combo.setCurrentIndex(len(self.jobs) - 1)
+        self.update_job_table()
+        self.log(f"新建任务: {name}")
+    
+    def remove_job(self):
+        if len(self.jobs) <= 1:
+            QMessageBox.information(self, "提示", "至少需要保留一个任务!")
+            return
+        
+        job = self.current_job
+        reply = QMessageBox.question(self, '确认', f'确定要删除任务: {job.name}?',
+                                   QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.stop_monitoring(job)
+            index = self.jobs.index(job)
+            self.jobs.remove(job)
+            self.save_jobs()
+            self.job_combo.removeItem(index)
+            self.update_job_table()
+            self.log(f"删除任务: {job.name}")
+    
+    def update_job_table(self):
+        self.job_table.setRowCount(len(self.jobs))
+        
+        for row, job in enumerate(self.jobs):
+            status = job.status + ("(监控中)" if job.monitoring else "")
+            last_sync = job.last_sync_time.strftime('%Y-%m-%d %H:%M:%S') if job.last_sync_time else "-"
+            self.job_table.setItem(row, 0, QTableWidgetItem(job.name))
+            self.job_table.setItem(row, 1, QTableWidgetItem(str(len(job.sync_paths))))
+            self.job_table.setItem(row, 2, QTableWidgetItem(status))
+            self.job_table.setItem(row, 3, QTableWidgetItem(last_sync))
+            self.job_table.setItem(row, 4, QTableWidgetItem(job.last_status))
+            watch_info = job.watch_info
+            if job.watcher:
+                watch_info = f"{job.watcher.describe()}; {watch_info}"
+            self.job_table.setItem(row, 5, QTableWidgetItem(watch_info))
+    
+    def update_interval(self):
+        job = self.current_job
+        job.interval = self.interval_spin.value()
+        self.save_jobs()
+        if job.monitoring and job.timer:
+            job.timer.start(job.interval * 1000)
+    
+    def update_worker_count(self):
+        self.scheduler.set_max_workers(self.worker_spin.value())
+        self.log(f"并发任务数设置为: {self.worker_spin.value()}")
+    
+    def update_io_budget(self):
+        self.io_budget.set_rate(self.io_budget_spin.value() * 1024 * 1024)
+        self.log(f"全局I/O预算设置为: {self.io_budget_spin.value() or '不限'} MB/s")
+    
+    def update_trust_window(self):
+        self.engine.mtime_trust_window = self.trust_window_spin.value()
+        self.log(f"目录mtime信任窗口设置为: {self.trust_window_spin.value()}秒")
+    
+    def update_shard_settings(self):
+        self.engine.sharding = self.sharding_check.isChecked()
+        self.engine.shard_count = self.shard_spin.value()
+        if self.engine.sharding:
+            self.log(f"多进程分片同步: 开启, {self.engine.shard_count} 个分片")
+        else:
+            self.log("多进程分片同步: 关闭")
+    
+    def update_verify_settings(self):
+        self.engine.verify_mode = self.verify_combo.currentData()
+        self.engine.verify_percent = self.verify_percent_spin.value()
+        self.engine.verify_min_size = self.verify_size_spin.value() * 1024 * 1024
+        self.log(f"复制校验设置为: {self.verify_combo.currentText()}")
+    
+    def update_version_settings(self):
+        self.version_store.keep_versions = self.keep_versions_spin.value()
+        self.version_store.keep_days = self.keep_days_spin.value()
+        enabled = self.versioning_check.isChecked()
+        self.engine.version_store = self.version_store if enabled else None
+        self.log(f"版本备份: {'开启' if enabled else '关闭'}")
+    
+    def clean_versions(self):
+        try:
+            removed = self.version_store.apply_retention()
+            freed = self.version_store.gc()
+        except OSError as e:
+            QMessageBox.warning(self, "错误", f"清理版本库失败: {str(e)}")
+            return
+        self.log(f"版本库清理: 删除 {removed} 个旧版本, 释放 {freed / 1024 / 1024:.1f}MB")
+        self.update_version_label()
+    
+    def update_version_label(self):
+        self.version_label.setText(f"版本库: {self.version_store.summary()}")
+    
     def update_sync_direction(self):
-        self.sync_direction = self.direction_combo.currentData()
+        self.current_job.sync_direction = self.direction_combo.currentData()
+        self.save_jobs()
         self.log(f"同步方向设置为: {self.direction_combo.currentText()}")
     
+    def update_watch_mode(self):
+        job = self.current_job
+        job.watch_mode = self.watch_mode_combo.currentData()
+        self.save_jobs()
+        self.log(f"监控方式设置为: {self.watch_mode_combo.currentText()}")
+        if job.monitoring:
+            # 重新注册监控使新方式生效
+            self.stop_monitoring(job)
+            self.start_monitoring(job)
+    
     def update_conflict_resolution(self):
-        self.conflict_resolution = self.conflict_combo.currentData()
+        self.current_job.conflict_resolution = self.conflict_combo.currentData()
+        self.save_jobs()
         self.log(f"冲突解决策略设置为: {self.conflict_combo.currentText()}")
     
     def apply_file_filters(self):
+        file_filters = dict(self.current_job.file_filters)
         extensions = self.ext_edit.text().strip()
         if extensions:
-            self.file_filters['extensions'] = [ext.strip().lower() for ext in extensions.split(',')]
+            file_filters['extensions'] = [ext.strip().lower() for ext in extensions.split(',')]
         else:
-            self.file_filters['extensions'] = []
+            file_filters['extensions'] = []
         
         try:
-            self.file_filters['min_size'] = int(self.min_size_edit.text()) * 1024 if self.min_size_edit.text() else 0
-            self.file_filters['max_size'] = int(self.max_size_edit.text()) * 1024 if self.max_size_edit.text() else 0
+            file_filters['min_size'] = int(self.min_size_edit.text()) * 1024 if self.min_size_edit.text() else 0
+            file_filters['max_size'] = int(self.max_size_edit.text()) * 1024 if self.max_size_edit.text() else 0
         except ValueError:
             QMessageBox.warning(self, "警告", "文件大小必须为整数!")
             return
         
-        self.file_filters['exclude_hidden'] = self.exclude_hidden_check.isChecked()
+        file_filters['exclude_hidden'] = self.exclude_hidden_check.isChecked()
+        self.current_job.file_filters = file_filters
+        self.save_jobs()
         
         self.log("文件过滤设置已更新:")
-        self.log(f"扩展名: {self.file_filters['extensions'] or '无限制'}")
-        self.log(f"大小范围: {self.file_filters['min_size']/1024 if self.file_filters['min_size'] else 0}KB - "
-                f"{self.file_filters['max_size']/1024 if self.file_filters['max_size'] else '∞'}KB")
-        self.log(f"排除隐藏文件: {'是' if self.file_filters['exclude_hidden'] else '否'}")
-    
-    def file_passes_filters(self, file_path):
-        # 检查扩展名
-        if self.file_filters['extensions']:
-            ext = os.path.splitext(file_path)[1].lower().lstrip('.')
-            if ext not in self.file_filters['extensions']:
-                return False
-        
-        # 检查文件大小
-        file_size = os.path.getsize(file_path)
-        if self.file_filters['min_size'] and file_size < self.file_filters['min_size']:
-            return False
-        if self.file_filters['max_size'] and file_size > self.file_filters['max_size']:
-            return False
-        
-        # 检查隐藏文件
-        if self.file_filters['exclude_hidden'] and os.path.basename(file_path).startswith('.'):
-            return False
-        
-        return True
+        self.log(f"扩展名: {file_filters['extensions'] or '无限制'}")
+        self.log(f"大小范围: {file_filters['min_size']/1024 if file_filters['min_size'] else 0}KB - "
+                f"{file_filters['max_size']/1024 if file_filters['max_size'] else '∞'}KB")
+        self.log(f"排除隐藏文件: {'是' if file_filters['exclude_hidden'] else '否'}")
     
     def update_buttons_state(self):
-        has_paths = len(self.sync_paths) > 0
-        self.start_btn.setEnabled(has_paths)
+        has_paths = len(self.current_job.sync_paths) > 0
+        self.start_btn.setEnabled(has_paths and not self.current_job.monitoring)
+        self.stop_btn.setEnabled(self.current_job.monitoring)
         self.sync_now_btn.setEnabled(has_paths)
         self.remove_btn.setEnabled(has_paths and self.path_list.currentRow() >= 0)
-        
+    
     def add_path(self):
         options = QFileDialog.Options()
         path, _ = QFileDialog.getOpenFileName(self, "选择文件", "", "All Files (*)", options=options)
@@ -297,13 +2976,15 @@ class FileSyncTool(QMainWindow):
             path = QFileDialog.getExistingDirectory(self, "选择文件夹")
         
         if path:
-            if path not in self.sync_paths:
-                reply = QMessageBox.question(self, '确认', f'确定要添加路径: {path}?', 
+            if path not in self.current_job.sync_paths:
+                reply = QMessageBox.question(self, '确认', f'确定要添加路径: {path}?',
                                           QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
                 if reply == QMessageBox.Yes:
-                    self.sync_paths.append(path)
+                    self.current_job.sync_paths.append(path)
                     self.path_list.addItem(path)
+                    self.save_jobs()
                     self.update_buttons_state()
+                    self.update_job_table()
                     self.log(f"添加路径: {path}")
             else:
                 QMessageBox.information(self, "提示", "该路径已存在!")
@@ -314,203 +2995,264 @@ class FileSyncTool(QMainWindow):
             item = self.path_list.item(current_row)
             path = item.text()
             
-            reply = QMessageBox.question(self, '确认', f'确定要移除路径: {path}?', 
+            reply = QMessageBox.question(self, '确认', f'确定要移除路径: {path}?',
                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
                 self.path_list.takeItem(current_row)
-                if path in self.sync_paths:
-                    self.sync_paths.remove(path)
+                if path in self.current_job.sync_paths:
+                    self.current_job.sync_paths.remove(path)
+                self.save_jobs()
                 self.log(f"移除路径: {path}")
                 self.update_buttons_state()
+                self.update_job_table()
     
-    def start_monitoring(self):
-        if len(self.sync_paths) < 2:
+    def start_monitoring(self, job=None):
+        job = job or self.current_job
+        if len(job.sync_paths) < 2:
             QMessageBox.warning(self, "警告", "至少需要两个路径才能同步!")
             return
-            
-        interval = self.interval_spin.value() * 1000  # 转换为毫秒
-        self.sync_timer.start(interval)
+        if job.monitoring:
+            return
         
-        # 启动文件监控
+        # 每个任务使用自己的定时器
+        job.timer = QTimer(self)
+        job.timer.timeout.connect(lambda: self.on_job_timer(job))
+        job.timer.start(job.interval * 1000)  # 转换为毫秒
+        
+        # 启动文件监控，所有任务共用一个 Observer
         if self.observer is None:
             self.observer = Observer()
-            for path in self.sync_paths:
-                if os.path.isdir(path):
-                    self.observer.schedule(self.sync_handler, path, recursive=True)
             self.observer.start()
+        start = time.perf_counter()
+        handler = SyncHandler(self, job)
+        watches = []
+        file_roots = {}
+        for path in job.sync_paths:
+            if os.path.isdir(path):
+                if job.watch_mode != "hybrid":
+                    watches.append((handler, path, True))
+            elif os.path.isfile(path):
+                file_roots.setdefault(os.path.dirname(os.path.abspath(path)), []).append(path)
+        # 同一目录下的文件根共用一个父目录监控
+        for parent, roots in file_roots.items():
+            watches.append((FileRootHandler(self, job, roots), parent, False))
+        
+        for watch_handler, path, recursive in watches:
+            try:
+                job.watches.append((watch_handler, self.observer.schedule(watch_handler, path, recursive=recursive)))
+            except OSError as e:
+                # 例如超出 inotify 监控数量上限，事件日志不再完整
+                self.journal.mark_incomplete(job.name, f"无法监控 {path}: {str(e)}")
+                self.log(f"[{job.name}] 无法监控 {path}: {str(e)}")
+        
+        if job.watch_mode == "hybrid":
+            job.watcher = HybridWatcher(self, job)
+            job.watcher.start()
+        elapsed = (time.perf_counter() - start) * 1000
+        watch_count = inotify_watch_count()
+        # 混合模式的热目录监控由 HybridWatcher 注册，同样计入
+        watches = len(job.watches) + (job.watcher.hot_count() if job.watcher else 0)
+        job.watch_info = f"{watches} 个监控, 注册 {elapsed:.0f}毫秒"
+        if watch_count is not None:
+            job.watch_info += f", 进程 inotify 监控 {watch_count} 个"
+        self.log(f"[{job.name}] 监控已注册: {job.watch_info}")
         
-        self.log(f"开始监控，同步间隔: {self.interval_spin.value()}秒")
+        job.monitoring = True
+        self.log(f"[{job.name}] 开始监控，同步间隔: {job.interval}秒")
         self.update_buttons_state()
+        self.update_job_table()
+    
+    def on_job_timer(self, job):
+        self.check_watches(job)
+        self.sync_files(job)
+    
+    def check_watches(self, job):
+        # watchdog 不把 inotify 队列溢出通知给处理器，溢出无法检测；这里只能发现监控线程已退出
+        # (例如读取事件出错)。之后的事件都会丢失，标记为不完整，重启后执行完整同步
+        alive = set()
+        if self.observer is not None and self.observer.is_alive():
+            alive = {emitter.watch for emitter in self.observer.emitters if emitter.is_alive()}
+        lost = [watch.path for _, watch in job.watches if watch not in alive]
+        if job.watcher and not job.watcher.observer.is_alive():
+            lost.append("混合监控")
+        if not lost:
+            return
+        self.journal.mark_incomplete(job.name, f"监控已停止: {lost[0]}")
+        if not job.watches_lost:
+            job.watches_lost = True
+            self.log(f"[{job.name}] 监控已停止({', '.join(lost)})，改为依靠定时完整同步")
     
-    def stop_monitoring(self):
-        self.sync_timer.stop()
+    def stop_monitoring(self, job=None):
+        job = job or self.current_job
+        if job.timer:
+            job.timer.stop()
+            job.timer = None
         
         if self.observer:
-            self.observer.stop()
-            self.observer = None
+            # 多个任务可能监控同一目录：其他任务仍在使用的监控只移除本任务的处理器，
+            # 否则注销监控，释放监控线程和 inotify 监控
+            in_use = [watch for other in self.jobs if other is not job for _, watch in other.watches]
+            unscheduled = []
+            for handler, watch in job.watches:
+                if watch in in_use:
+                    self.observer.remove_handler_for_watch(handler, watch)
+                elif watch not in unscheduled:
+                    self.observer.unschedule(watch)
+                    unscheduled.append(watch)
+        job.watches = []
+        job.watches_lost = False
+        if job.watcher:
+            job.watcher.stop()
+            job.watcher = None
+        job.watch_info = ""
         
-        self.log("停止监控")
+        if job.monitoring:
+            job.monitoring = False
+            self.log(f"[{job.name}] 停止监控")
         self.update_buttons_state()
+        self.update_job_table()
     
-    def resolve_conflict(self, src_path, dest_path):
-        if self.conflict_resolution == "ask":
-            msg = QMessageBox()
-            msg.setIcon(QMessageBox.Question)
-            msg.setText("发现文件冲突，请选择操作:")
-            msg.setWindowTitle("文件冲突")
-            msg.setDetailedText(f"源文件: {src_path}\n修改时间: {datetime.fromtimestamp(os.path.getmtime(src_path))}\n大小: {os.path.getsize(src_path)} bytes\n\n"
-                              f"目标文件: {dest_path}\n修改时间: {datetime.fromtimestamp(os.path.getmtime(dest_path))}\n大小: {os.path.getsize(dest_path)} bytes")
-            
-            keep_src_btn = msg.addButton("保留源文件", QMessageBox.AcceptRole)
-            keep_dest_btn = msg.addButton("保留目标文件", QMessageBox.RejectRole)
-            cancel_btn = msg.addButton("取消", QMessageBox.DestructiveRole)
-            
-            msg.exec_()
-            
-            if msg.clickedButton() == keep_src_btn:
-                return "source"
-            elif msg.clickedButton() == keep_dest_btn:
-                return "destination"
-            else:
-                return "skip"
-        elif self.conflict_resolution == "newer":
-            src_mtime = os.path.getmtime(src_path)
-            dest_mtime = os.path.getmtime(dest_path)
-            return "source" if src_mtime > dest_mtime else "destination"
-        else:  # larger
-            src_size = os.path.getsize(src_path)
-            dest_size = os.path.getsize(dest_path)
-            return "source" if src_size > dest_size else "destination"
+    def sync_files(self, job=None, targets=None):
+        # 把同步请求交给共享线程池，定时器、文件事件和按钮都经过这里；targets 为 None 时完整同步
+        job = job or self.current_job
+        if len(job.sync_paths) < 2:
+            return False
+        queued = self.scheduler.submit(job, targets)
+        self.job_status_changed.emit()
+        return queued
     
-    def sync_files(self):
-        if len(self.sync_paths) < 2:
-            return
-            
-        self.log("开始同步文件...")
+    def replay_journal(self):
+        self.journal.clear_global_incomplete([job.name for job in self.jobs])
+        for job in self.jobs:
+            paths, ops, reason = self.journal.pending(job.name)
+            if len(job.sync_paths) < 2:
+                continue
+            if reason:
+                # 日志不完整，只能完整扫描
+                self.log(f"[{job.name}] 事件日志不完整({reason})，执行完整同步")
+                self.scheduler.submit(job)
+            elif paths or ops:
+                self.log(f"[{job.name}] 重放事件日志: {len(paths)} 个路径, {len(ops)} 个未完成操作")
+                self.scheduler.submit(job, set(paths))
+    
+    def run_job(self, job, targets=None):
+        # 在工作线程中执行
         start_time = datetime.now()
-        file_count = 0
-        success = True
+        job.status = "同步中"
+        self.job_status_changed.emit()
+        profile = self.profiler.start(job) if self.profiler.remaining else None
+        event_metrics, job.event_metrics = job.event_metrics, Counter()
         
-        try:
-            # 单向同步逻辑
-            if self.sync_direction in ["source_to_dest", "dest_to_source"]:
-                source_idx = 0 if self.sync_direction == "source_to_dest" else 1
-                dest_idx = 1 if self.sync_direction == "source_to_dest" else 0
-                
-                source = self.sync_paths[source_idx]
-                destination = self.sync_paths[dest_idx]
-                
-                if os.path.isfile(source) and os.path.isfile(destination):
-                    # 文件同步
-                    if self.file_passes_filters(source):
-                        shutil.copy2(source, destination)
-                        file_count += 1
-                        self.log(f"同步文件: 从 {source} 到 {destination}")
-                elif os.path.isdir(source) and os.path.isdir(destination):
-                    # 文件夹同步
-                    for root, _, files in os.walk(source):
-                        rel_path = os.path.relpath(root, source)
-                        dest_dir = os.path.join(destination, rel_path)
-                        
-                        if not os.path.exists(dest_dir):
-                            os.makedirs(dest_dir)
-                        
-                        for file in files:
-                            src_file = os.path.join(root, file)
-                            if self.file_passes_filters(src_file):
-                                dest_file = os.path.join(dest_dir, file)
-                                
-                                if not os.path.exists(dest_file) or os.path.getmtime(src_file) > os.path.getmtime(dest_file):
-                                    shutil.copy2(src_file, dest_file)
-                                    file_count += 1
-                                    self.log(f"同步文件: 从 {src_file} 到 {dest_file}")
-            else:
-                # 双向同步逻辑
-                all_files = {}
-                
-                # 收集所有文件信息
-                for path in self.sync_paths:
-                    if os.path.isfile(path):
-                        if self.file_passes_filters(path):
-                            filename = os.path.basename(path)
-                            mtime = os.path.getmtime(path)
-                            size = os.path.getsize(path)
-                            
-                            if filename not in all_files or mtime > all_files[filename]['mtime']:
-                                all_files[filename] = {
-                                    'path': path,
-                                    'mtime': mtime,
-                                    'size': size
-                                }
-                    elif os.path.isdir(path):
-                        for root, _, files in os.walk(path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                if self.file_passes_filters(file_path):
-                                    rel_path = os.path.relpath(file_path, path)
-                                    mtime = os.path.getmtime(file_path)
-                                    size = os.path.getsize(file_path)
-                                    
-                                    if rel_path not in all_files or mtime > all_files[rel_path]['mtime']:
-                                        all_files[rel_path] = {
-                                            'path': file_path,
-                                            'mtime': mtime,
-                                            'size': size,
-                                            'source_path': path
-                                        }
-                
-                # 执行同步
-                for rel_path, file_info in all_files.items():
-                    for path in self.sync_paths:
-                        if os.path.isdir(path):
-                            dest_path = os.path.join(path, rel_path)
-                            if not os.path.exists(dest_path) or os.path.getmtime(file_info['path']) > os.path.getmtime(dest_path):
-                                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                                shutil.copy2(file_info['path'], dest_path)
-                                file_count += 1
-                                self.log(f"同步文件: 从 {file_info['path']} 到 {dest_path}")
-                        elif os.path.isfile(path) and path != file_info['path']:
-                            resolution = self.resolve_conflict(file_info['path'], path)
-                            if resolution == "source":
-                                shutil.copy2(file_info['path'], path)
-                                file_count += 1
-                                self.log(f"同步文件(冲突解决): 从 {file_info['path']} 到 {path}")
-                            elif resolution == "destination":
-                                shutil.copy2(path, file_info['path'])
-                                file_count += 1
-                                self.log(f"同步文件(冲突解决): 从 {path} 到 {file_info['path']}")
-            
-            self.last_sync_time = datetime.now()
-            status = f"成功同步 {file_count} 个文件"
-            self.log(f"同步完成: {status}")
-        except Exception as e:
-            status = f"同步失败: {str(e)}"
-            self.log(status)
-            success = False
+        if targets is None:
+            file_count, status, success, run = self.engine.sync_job(job)
+        else:
+            file_count, status, success, run = self.engine.sync_targets(job, targets)
+        if job.watches_lost:
+            # 完整同步清除了不完整标记，但之后的事件仍不会记录
+            self.journal.mark_incomplete(job.name, "监控已停止")
         
-        # 记录历史
-        self.record_sync_history(start_time, datetime.now(), file_count, status)
-        self.update_history_table()
+        profile_path = None
+        if profile:
+            try:
+                profile_path = self.profiler.finish(profile)
+                self.log(f"[{job.name}] 剖析结果已保存: {profile_path}")
+            except OSError as e:
+                self.log(f"[{job.name}] 无法保存剖析结果: {str(e)}")
         
-        return success
-    
-    def record_sync_history(self, start_time, end_time, file_count, status):
-        self.sync_history.append({
+        job.status = "空闲"
+        job.last_status = status
+        self.sync_finished.emit({
             'start': start_time,
-            'end': end_time,
+            'end': datetime.now(),
+            'job': job.name,
             'file_count': file_count,
             'status': status,
-            'paths': self.sync_paths.copy()
+            'success': success,
+            'paths': list(job.sync_paths),
+            'targets': None if targets is None else len(targets),
+            'metrics': {**event_metrics, **run.metrics},
+            'verify_mismatches': run.verify_mismatches,
+            'profile': profile_path
         })
     
+    def on_sync_finished(self, record):
+        # 记录历史
+        self.sync_history.append(record)
+        self.update_history_table()
+        self.update_conflict_table()
+        self.update_job_table()
+    
+    def update_conflict_table(self):
+        entries = self.conflict_queue.entries
+        labels = {rule: label for label, rule in CONFLICT_RULES}
+        self.conflict_table.setRowCount(len(entries))
+        
+        for row, entry in enumerate(entries):
+            job_item = QTableWidgetItem(entry.get('job', ""))
+            job_item.setData(Qt.UserRole, entry['id'])
+            self.conflict_table.setItem(row, 0, job_item)
+            self.conflict_table.setItem(row, 1, QTableWidgetItem(entry['src']))
+            self.conflict_table.setItem(row, 2, QTableWidgetItem(entry['dest']))
+            self.conflict_table.setItem(row, 3, QTableWidgetItem(entry['detected']))
+            self.conflict_table.setItem(row, 4, QTableWidgetItem(labels.get(entry['resolution'], "待处理")))
+        
+        pending = self.conflict_queue.pending_count()
+        self.tabs.setTabText(self.tabs.indexOf(self.conflict_tab),
+                             f"冲突队列 ({pending})" if pending else "冲突队列")
+    
+    def resolve_selected_conflicts(self):
+        rows = {index.row() for index in self.conflict_table.selectionModel().selectedRows()}
+        entry_ids = {self.conflict_table.item(row, 0).data(Qt.UserRole) for row in rows}
+        self.set_conflict_resolution(entry_ids)
+    
+    def resolve_matching_conflicts(self):
+        pattern = self.conflict_pattern_edit.text().strip() or '*'
+        entry_ids = {entry['id'] for entry in self.conflict_queue.entries
+                     if fnmatch.fnmatch(entry['src'], pattern) or fnmatch.fnmatch(entry['dest'], pattern)}
+        self.set_conflict_resolution(entry_ids)
+    
+    def set_conflict_resolution(self, entry_ids):
+        if not entry_ids:
+            QMessageBox.information(self, "提示", "没有匹配的冲突!")
+            return
+        rule = self.conflict_rule_combo.currentData()
+        self.conflict_queue.set_resolution(entry_ids, rule)
+        self.log(f"已为 {len(entry_ids)} 个冲突设置处理方式: {self.conflict_rule_combo.currentText()}")
+        self.update_conflict_table()
+    
     def update_history_table(self):
         self.history_table.setRowCount(len(self.sync_history))
         
         for row, record in enumerate(self.sync_history):
             self.history_table.setItem(row, 0, QTableWidgetItem(record['start'].strftime('%Y-%m-%d %H:%M:%S')))
-            self.history_table.setItem(row, 1, QTableWidgetItem(f"{len(record['paths'])}个路径"))
-            self.history_table.setItem(row, 2, QTableWidgetItem(str(record['file_count'])))
-            self.history_table.setItem(row, 3, QTableWidgetItem(record['status']))
+            self.history_table.setItem(row, 1, QTableWidgetItem(record['job']))
+            operation = f"{len(record['paths'])}个路径"
+            if record['targets'] is not None:
+                operation += f", 定向{record['targets']}个"
+            self.history_table.setItem(row, 2, QTableWidgetItem(operation))
+            self.history_table.setItem(row, 3, QTableWidgetItem(str(record['file_count'])))
+            self.history_table.setItem(row, 4, QTableWidgetItem(record['status']))
+            self.history_table.setItem(row, 5, QTableWidgetItem(format_metrics(record['metrics'])))
+            self.history_table.setItem(row, 6, QTableWidgetItem(record['profile'] or ""))
+        self.update_version_label()
+        self.update_profile_label()
+    
+    def arm_profiler(self):
+        self.profiler.arm(self.profile_runs_spin.value(), self.profile_mode_combo.currentData())
+        self.log(f"将剖析接下来的 {self.profile_runs_spin.value()} 次同步: {self.profile_mode_combo.currentText()}")
+        self.update_profile_label()
+    
+    def update_profile_label(self):
+        remaining = self.profiler.remaining
+        self.profile_label.setText(f"待剖析 {remaining} 次" if remaining else "")
+    
+    def open_profile(self, row, column):
+        # 双击剖析文件列打开所在目录
+        if column != 6 or row >= len(self.sync_history):
+            return
+        path = self.sync_history[row]['profile']
+        if path:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(path)))
     
     def clear_history(self):
         self.sync_history.clear()
@@ -524,27 +3266,362 @@ class FileSyncTool(QMainWindow):
         if file_name:
             try:
                 with open(file_name, 'w', encoding='utf-8') as f:
-                    f.write("开始时间,结束时间,路径数量,文件数量,状态,路径\n")
+                    f.write("开始时间,结束时间,任务,路径数量,文件数量,状态,路径,指标,剖析文件\n")
                     for record in self.sync_history:
                         paths = ';'.join(record['paths'])
                         f.write(f"{record['start'].strftime('%Y-%m-%d %H:%M:%S')},"
                                f"{record['end'].strftime('%Y-%m-%d %H:%M:%S')},"
-                               f"{len(record['paths'])},{record['file_count']},"
-                               f"{record['status']},\"{paths}\"\n")
+                               f"\"{record['job']}\",{len(record['paths'])},{record['file_count']},"
+                               f"{record['status']},\"{paths}\","
+                               f"\"{format_metrics(record['metrics'])}\",\"{record['profile'] or ''}\"\n")
                 self.log(f"历史记录已导出到: {file_name}")
             except Exception as e:
                 QMessageBox.warning(self, "导出失败", f"无法导出历史记录: {str(e)}")
     
     def log(self, message):
+        # 可在任意线程调用
         timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        self.log_text.append(f"{timestamp} {message}")
+        self.log_message.emit(f"{timestamp} {message}")
+    
+    def append_log(self, text):
+        self.log_text.append(text)
+    
+    def shutdown(self):
+        for job in self.jobs:
+            self.stop_monitoring(job)
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
+        self.scheduler.shutdown()
+        self.engine.shutdown()
+        self.journal.close()
     
     def closeEvent(self, event):
-        self.stop_monitoring()
+        self.shutdown()
         event.accept()
 
-if __name__ == "__main__":
+class SoakTestHarness:
+    # 事件到副本延迟的长时间测试：在第一个根目录中按写入模式产生变更，
+    # 轮询其他根目录，记录每个变更出现在所有副本上的延迟和超时未同步的变更
+    PATTERNS = ("burst", "trickle", "rewrite", "rename", "mixed")
+    
+    def __init__(self, roots, pattern, rate=5, burst_size=200, large_file_mb=64, timeout=30):
+        self.roots = roots
+        self.pattern = pattern
+        self.rate = rate
+        self.burst_size = burst_size
+        self.large_file_size = large_file_mb * 1024 * 1024
+        self.timeout = timeout
+        self.pending = {}  # 相对路径 -> (写入时间, 大小, 修改时间ns)
+        self.latencies = []
+        self.changes = 0
+        self.missed = 0
+        self.superseded = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+    
+    def _expect(self, rel_path):
+        stat = os.stat(os.path.join(self.roots[0], rel_path))
+        with self._lock:
+            if rel_path in self.pending:
+                self.superseded += 1
+            self.pending[rel_path] = (time.monotonic(), stat.st_size, stat.st_mtime_ns)
+            self.changes += 1
+    
+    def _write(self, rel_path, size):
+        path = os.path.join(self.roots[0], rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        self._expect(rel_path)
+    
+    def _next_name(self, prefix):
+        self._counter += 1
+        return f"{prefix}/d{self._counter % 16}/f{self._counter}.bin"
+    
+    def _burst(self):
+        for _ in range(self.burst_size):
+            self._write(self._next_name("burst"), random.randint(1, 64 * 1024))
+        self._stop.wait(max(1.0, self.burst_size / max(self.rate, 1)))
+    
+    def _trickle(self):
+        self._write(self._next_name("trickle"), random.randint(1, 16 * 1024))
+        self._stop.wait(1.0 / max(self.rate, 1))
+    
+    def _rewrite(self):
+        self._write("rewrite/large.bin", self.large_file_size)
+        self._stop.wait(max(1.0, 10.0 / max(self.rate, 1)))
+    
+    def _rename(self):
+        names = [self._next_name("rename") for _ in range(self.burst_size)]
+        for name in names:
+            self._write(name, 1024)
+        self._stop.wait(self.timeout / 2)
+        for name in names:
+            if self._stop.is_set():
+                break
+            new_name = name + ".renamed"
+            os.rename(os.path.join(self.roots[0], name), os.path.join(self.roots[0], new_name))
+            self._expect(new_name)
+        self._stop.wait(max(1.0, self.burst_size / max(self.rate, 1)))
+    
+    def _generate(self):
+        steps = {'burst': self._burst, 'trickle': self._trickle, 'rewrite': self._rewrite, 'rename': self._rename}
+        cycle = ["trickle", "burst", "rewrite", "rename"] if self.pattern == "mixed" else [self.pattern]
+        while not self._stop.is_set():
+            for name in cycle:
+                if self._stop.is_set():
+                    break
+                steps[name]()
+    
+    def _replicated(self, rel_path, size, mtime_ns):
+        for root in self.roots[1:]:
+            try:
+                stat = os.stat(os.path.join(root, rel_path))
+            except OSError:
+                return False
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                return False
+        return True
+    
+    def _check(self):
+        while not self._stop.is_set() or self.pending:
+            with self._lock:
+                items = list(self.pending.items())
+            for rel_path, (written, size, mtime_ns) in items:
+                now = time.monotonic()
+                replicated = self._replicated(rel_path, size, mtime_ns)
+                with self._lock:
+                    if self.pending.get(rel_path, (None,))[0] != written:
+                        continue
+                    if replicated:
+                        del self.pending[rel_path]
+                        self.latencies.append(now - written)
+                    elif now - written > self.timeout:
+                        del self.pending[rel_path]
+                        self.missed += 1
+            time.sleep(0.01)
+    
+    def start(self):
+        self._threads = [threading.Thread(target=self._generate, daemon=True),
+                         threading.Thread(target=self._check, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+    
+    def stop(self):
+        # 停止产生变更，等待剩余变更同步完成或超时
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+    
+    def report(self):
+        latencies = sorted(self.latencies)
+        
+        def percentile(q):
+            return latencies[int(round(q * (len(latencies) - 1)))] * 1000 if latencies else None
+        
+        return {
+            'pattern': self.pattern,
+            'changes': self.changes,
+            'replicated': len(latencies),
+            'missed': self.missed,
+            'superseded': self.superseded,
+            'latency_p50_ms': percentile(0.5),
+            'latency_p99_ms': percentile(0.99),
+            'latency_max_ms': latencies[-1] * 1000 if latencies else None
+        }
+
+def run_manifest_command(args):
+    if args.manifest_command == 'create':
+        start = time.perf_counter()
+        count = write_manifest(args.root, args.output, iter_tree_entries(args.root))
+        print(f"已生成清单: {args.output}, {count} 个文件, 用时 {time.perf_counter() - start:.2f}秒")
+        return 0
+    
+    if args.manifest_command == 'info':
+        manifest = Manifest(args.manifest)
+        created = datetime.fromtimestamp(manifest.created_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"根路径: {manifest.root}\n文件数: {len(manifest)}\n生成时间: {created}")
+        manifest.close()
+        return 0
+    
+    # plan: 两侧各自可以是目录或清单
+    source_root, source_entries = open_tree_entries(args.source)
+    dest_root, dest_entries = open_tree_entries(args.dest)
+    source_root = args.source_root or source_root
+    dest_root = args.dest_root or dest_root
+    
+    engine = SyncEngine(print, ConflictQueue(os.path.join(APP_DATA_DIR, 'conflicts.json')), IOBudget())
+    job = SyncJob("清单同步", [source_root, dest_root], args.direction)
+    start = time.perf_counter()
+    plan = list(engine.plan_from_entries(source_entries, dest_entries, job.sync_direction, job.file_filters))
+    print(f"同步计划: {len(plan)} 个文件, 用时 {(time.perf_counter() - start) * 1000:.1f}毫秒")
+    
+    if not args.apply:
+        for rel_path, direction in plan:
+            print(f"{'->' if direction == 'to_dest' else '<-'} {rel_path}")
+        return 0
+    file_count, run = engine.apply_plan(job, plan, source_root, dest_root)
+    engine.shutdown()
+    failures = run.metrics['plan_copy_failures']
+    if failures:
+        print(f"同步完成: 成功同步 {file_count} 个文件, {failures} 个文件失败")
+        return 1
+    print(f"同步完成: 成功同步 {file_count} 个文件")
+    return 0
+
+def run_versions_command(args):
+    store = VersionStore(os.path.join(args.data_dir, 'versions'))
+    if args.versions_command == 'stats':
+        print(store.summary())
+        return 0
+    
+    if args.versions_command == 'gc':
+        store.keep_versions, store.keep_days = args.keep, args.keep_days
+        removed = store.apply_retention()
+        freed = store.gc()
+        print(f"删除 {removed} 个旧版本, 释放 {freed / 1024 / 1024:.1f}MB")
+        print(store.summary())
+        return 0
+    
+    path = os.path.abspath(args.path)
+    if args.versions_command == 'list':
+        versions = store.versions(path)
+        if not versions:
+            print(f"没有 {path} 的历史版本")
+            return 1
+        for number, version in enumerate(versions, 1):
+            saved = datetime.fromtimestamp(version['saved']).strftime('%Y-%m-%d %H:%M:%S')
+            modified = datetime.fromtimestamp(version['mtime_ns'] / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{number:4d}  保存于 {saved}  修改于 {modified}  {version['size']} 字节")
+        return 0
+    
+    try:
+        version = store.restore(path, args.version, args.output and os.path.abspath(args.output))
+    except (ValueError, OSError) as e:
+        print(f"恢复失败: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"已恢复 {version['size']} 字节到 {args.output or path}")
+    return 0
+
+def run_soak_command(args):
+    # 无需显示器：使用 Qt 的 offscreen 平台
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication(sys.argv[:1])
+    
+    work_dir = tempfile.mkdtemp(prefix='sync_soak_')
+    roots = [os.path.join(work_dir, f"root{index}") for index in range(args.roots)]
+    for root in roots:
+        os.makedirs(root)
+    
+    tool = FileSyncTool(data_dir=os.path.join(work_dir, 'data'))
+    tool.log_text.document().setMaximumBlockCount(1000)
+    job = tool.current_job
+    job.sync_paths = roots
+    job.interval = 3600  # 只测量事件驱动的同步
+    tool.start_monitoring(job)
+    if args.profile_runs:
+        # 剖析文件写入工作目录，使用 --keep 保留
+        tool.profiler.arm(args.profile_runs, args.profile_mode)
+    
+    harness = SoakTestHarness(roots, args.pattern, args.rate, args.burst_size, args.large_file_mb, args.timeout)
+    print(f"压力测试开始: 模式 {args.pattern}, 时长 {args.duration}秒, 工作目录 {work_dir}")
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    harness.start()
+    QTimer.singleShot(int(args.duration * 1000), app.quit)
+    app.exec_()
+    harness.stop()
+    cpu_percent = (time.process_time() - cpu_start) / (time.monotonic() - wall_start) * 100
+    tool.shutdown()
+    
+    report = harness.report()
+    report.update({
+        'duration_s': args.duration,
+        'roots': args.roots,
+        'cpu_percent': round(cpu_percent, 1),
+        'echo_events_dropped': tool.engine.metrics['echo_events_dropped'],
+        'sync_runs': len(tool.sync_history)
+    })
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if report['missed'] else 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="高级文件同步工具，不带参数时启动图形界面")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    manifest_parser = subparsers.add_parser('manifest', help="生成和比较目录树清单")
+    manifest_commands = manifest_parser.add_subparsers(dest='manifest_command', required=True)
+    
+    create_parser = manifest_commands.add_parser('create', help="扫描目录生成清单")
+    create_parser.add_argument('root', help="要扫描的目录")
+    create_parser.add_argument('output', help="清单文件路径")
+    
+    info_parser = manifest_commands.add_parser('info', help="查看清单信息")
+    info_parser.add_argument('manifest', help="清单文件路径")
+    
+    plan_parser = manifest_commands.add_parser('plan', help="由清单或目录计算同步计划")
+    plan_parser.add_argument('source', help="源目录或清单文件")
+    plan_parser.add_argument('dest', help="目标目录或清单文件")
+    plan_parser.add_argument('--direction', choices=["source_to_dest", "bidirectional"], default="source_to_dest")
+    plan_parser.add_argument('--apply', action='store_true', help="按计划执行复制")
+    plan_parser.add_argument('--source-root', help="执行复制时使用的源目录(默认为清单中记录的根路径)")
+    plan_parser.add_argument('--dest-root', help="执行复制时使用的目标目录(默认为清单中记录的根路径)")
+    
+    soak_parser = subparsers.add_parser('soak', help="事件到副本延迟压力测试(无界面)")
+    soak_parser.add_argument('--pattern', choices=SoakTestHarness.PATTERNS, default="mixed", help="写入模式")
+    soak_parser.add_argument('--duration', type=float, default=600, help="测试时长(秒)")
+    soak_parser.add_argument('--roots', type=int, default=3, help="同步根目录数量")
+    soak_parser.add_argument('--rate', type=float, default=5, help="每秒变更数")
+    soak_parser.add_argument('--burst-size', type=int, default=200, help="突发写入/批量重命名的文件数")
+    soak_parser.add_argument('--large-file-mb', type=int, default=64, help="大文件重写的大小(MB)")
+    soak_parser.add_argument('--timeout', type=float, default=30, help="超过该时间未同步即计为丢失(秒)")
+    soak_parser.add_argument('--report', help="把结果写入 JSON 文件")
+    soak_parser.add_argument('--keep', action='store_true', help="保留临时工作目录")
+    
+    versions_parser = subparsers.add_parser('versions', help="查看、恢复和清理文件的历史版本")
+    versions_parser.add_argument('--data-dir', default=APP_DATA_DIR, help="应用数据目录")
+    versions_commands = versions_parser.add_subparsers(dest='versions_command', required=True)
+    
+    list_parser = versions_commands.add_parser('list', help="列出文件的历史版本")
+    list_parser.add_argument('path', help="文件路径")
+    
+    restore_parser = versions_commands.add_parser('restore', help="恢复文件的历史版本")
+    restore_parser.add_argument('path', help="文件路径")
+    restore_parser.add_argument('--version', type=int, help="版本号(默认最新)")
+    restore_parser.add_argument('--output', help="写到其他位置而不是覆盖原文件")
+    
+    gc_parser = versions_commands.add_parser('gc', help="按保留策略删除旧版本并回收空间")
+    gc_parser.add_argument('--keep', type=int, default=10, help="每个文件保留的版本数(0为不限)")
+    gc_parser.add_argument('--keep-days', type=int, default=30, help="版本保留天数(0为不限)")
+    
+    versions_commands.add_parser('stats', help="查看版本库大小和去重率")
+    
+    parser.add_argument('--profile-runs', type=int, default=0, help="剖析接下来的 N 次同步(图形界面和压力测试)")
+    parser.add_argument('--profile-mode', choices=RunProfiler.MODES, default="cprofile",
+                        help="cprofile 输出 .pstats，sampling 输出折叠栈 .folded")
+    
+    args = parser.parse_args(argv)
+    if args.command == 'manifest':
+        return run_manifest_command(args)
+    if args.command == 'versions':
+        return run_versions_command(args)
+    if args.command == 'soak':
+        return run_soak_command(args)
+    
     app = QApplication(sys.argv)
     sync_tool = FileSyncTool()
+    if args.profile_runs:
+        sync_tool.profiler.arm(args.profile_runs, args.profile_mode)
+        sync_tool.update_profile_label()
     sync_tool.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    return app.exec_()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))